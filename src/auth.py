@@ -1,8 +1,10 @@
 # src/auth.py
 from __future__ import annotations
 
+import os
 import json
 import logging
+import tempfile
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any, Dict
@@ -47,7 +49,15 @@ def load_tokens() -> Dict[str, Any] | None:
 
 
 def save_tokens(tokens: Dict[str, Any]) -> None:
-    TOKENS_PATH.write_text(json.dumps(tokens, ensure_ascii=False, indent=2), encoding="utf-8")
+    # tmp + os.replace: quem lê em paralelo vê o arquivo antigo ou o novo, nunca um truncado
+    fd, tmp = tempfile.mkstemp(dir=TOKENS_PATH.parent, prefix=TOKENS_PATH.name + "_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps(tokens, ensure_ascii=False, indent=2))
+        os.replace(tmp, TOKENS_PATH)
+    except BaseException:
+        os.remove(tmp)
+        raise
     logging.info("💾 Tokens salvos em %s", TOKENS_PATH)
 
 
@@ -2,18 +2,20 @@
 from __future__ import annotations
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 
 from requests.exceptions import HTTPError
 
 from .report_utils import (
-    log, HDR_V2,
+    log, HDR_V2, PAGE_SIZE,
     RAW_DIR, PROCESSED_DIR, RESET_CSVS,
     METRICS_DAILY,
-    _read_csv,
+    _read_csv, _file_sig,
     write_csv_upsert_flexible,
-    enviar_para_google_sheets,
+    enviar_para_google_sheets, batch_uploads,
     _flatten_raw_daily, _with_meta,
     _promote_to_processed,
 )
@@ -21,6 +23,9 @@ from .meli_client import meli_get
 
 # Se quiser isolar métricas de Brand Ads, troque aqui:
 METRICS_DAILY_BRAND = METRICS_DAILY
+METRICS_DAILY_BRAND_CSV = ",".join(METRICS_DAILY_BRAND)
+
+PIPELINE_WORKERS = 4  # um worker por job do pipeline
 
 # Cache do "base path" válido para Brand Ads por brand
 # Ex.: "/advertising/brands/{brand_id}"
@@ -74,11 +79,14 @@ def _brand_search_all(brand_id: str, site_id: str, suffix: str, params: Dict[str
     """
     base = _resolve_brand_base(brand_id, site_id)
     out: List[Dict[str, Any]] = []
-    limit = int(params.get("limit", 200))
+    limit = PAGE_SIZE or int(params.get("limit", 200))
+    ep = f"{base}{suffix}"
+    p = dict(params)  # um único dict de params; só o offset muda entre páginas
+    p["limit"] = limit
     offset = 0
     while True:
-        ep = f"{base}{suffix}"
-        page = meli_get(ep, params={**params, "limit": limit, "offset": offset}, headers=HDR_V2)
+        p["offset"] = offset
+        page = meli_get(ep, params=p, headers=HDR_V2)
         if not isinstance(page, dict):
             log.warning("⚠️ Resposta não-JSON em %s (offset=%s). Encerrando paginação.", ep, offset)
             break
@@ -95,11 +103,17 @@ def _brand_search_all(brand_id: str, site_id: str, suffix: str, params: Dict[str
 # ---------------------------------------------------------------------
 def _load_brand_campaign_dim(brand_id: str) -> Dict[str, Dict[str, str]]:
     path = os.path.join(PROCESSED_DIR, f"brand_campaign_summary_{brand_id}.csv")
+    return _brand_campaign_dim_cached(path, _file_sig(path))
+
+
+@lru_cache(maxsize=64)
+def _brand_campaign_dim_cached(path: str, sig: Optional[Tuple[int, int]]) -> Dict[str, Dict[str, str]]:
     _, rows = _read_csv(path)
     dim: Dict[str, Dict[str, str]] = {}
     for r in rows:
-        cid = str(r.get("campaign_id") or r.get("id") or "").strip()
-        name = str(r.get("campaign_name") or r.get("name") or "").strip()
+        g = r.get
+        cid = (g("campaign_id") or g("id") or "").strip()
+        name = (g("campaign_name") or g("name") or "").strip()
         if cid:
             dim[cid] = {"name": name}
     return dim
@@ -141,7 +155,8 @@ def job_brand_campaigns_summary(brand_id: str, site_id: str) -> str:
     for r in data or []:
         if not isinstance(r, dict):
             continue
-        out: Dict[str, Any] = {k: v for k, v in r.items() if not isinstance(v, (list, dict))}
+        # respostas do orjson: list/dict são sempre os tipos exatos (checagem por identidade)
+        out: Dict[str, Any] = {k: v for k, v in r.items() if type(v) is not dict and type(v) is not list}
         camp = r.get("campaign") or {}
         out["campaign_id"] = camp.get("id") or r.get("campaign_id") or out.get("campaign_id")
         out["campaign_name"] = camp.get("name") or r.get("campaign_name") or out.get("campaign_name")
@@ -170,7 +185,7 @@ def job_brand_ads_summary(brand_id: str, site_id: str) -> str:
     for r in data or []:
         if not isinstance(r, dict):
             continue
-        out: Dict[str, Any] = {k: v for k, v in r.items() if not isinstance(v, (list, dict))}
+        out: Dict[str, Any] = {k: v for k, v in r.items() if type(v) is not dict and type(v) is not list}
         ad = r.get("ad") or {}
         item = r.get("item") or {}
         camp = r.get("campaign") or {}
@@ -215,13 +230,12 @@ def job_brand_campaigns_daily(brand_id: str, site_id: str, date_from: str, date_
     CHUNK = 50
     rows: List[Dict[str, Any]] = []
 
-    metrics = ",".join(METRICS_DAILY_BRAND)
     for i in range(0, len(ids), CHUNK):
         chunk = ids[i:i + CHUNK]
         params = {
             "date_from": date_from,
             "date_to": date_to,
-            "metrics": metrics,
+            "metrics": METRICS_DAILY_BRAND_CSV,
             "aggregation_type": "DAILY",
             "limit": 200,
             "filters[campaign_ids]": ",".join(chunk),
@@ -230,6 +244,9 @@ def job_brand_campaigns_daily(brand_id: str, site_id: str, date_from: str, date_
         for r in data or []:
             if not isinstance(r, dict):
                 continue
+            # sem data não vira linha: descarta antes de achatar
+            if not (r.get("date") or r.get("day") or r.get("report_date")):
+                continue
             flat = _flatten_raw_daily(r)
             if not flat.get("date"):
                 continue
@@ -269,7 +286,7 @@ def job_brand_ads_daily(brand_id: str, site_id: str, date_from: str, date_to: st
     base_params = {
         "date_from": date_from,
         "date_to": date_to,
-        "metrics": ",".join(METRICS_DAILY_BRAND),
+        "metrics": METRICS_DAILY_BRAND_CSV,
         "aggregation_type": "DAILY",
         "limit": 200,
     }
@@ -285,6 +302,9 @@ def job_brand_ads_daily(brand_id: str, site_id: str, date_from: str, date_to: st
         for r in (data or []):
             if not isinstance(r, dict):
                 continue
+            # sem data não vira linha: descarta antes de achatar
+            if not (r.get("date") or r.get("day") or r.get("report_date")):
+                continue
             flat = _flatten_raw_daily(r)
             if not flat.get("date"):
                 continue
@@ -324,10 +344,20 @@ def run_brand_ads_pipeline(brand_id: str, site_id: str, backfill_days: int = 30,
     log.info("🚀 Iniciando pipeline Brand Ads para brand_id=%s (site=%s)", brand_id, site_id)
     log.info("🏃 Brand Ads %s → %s", df, dt)
 
-    p3 = job_brand_campaigns_summary(brand_id, site_id)
-    p4 = job_brand_ads_summary(brand_id, site_id)
-    p1 = job_brand_campaigns_daily(brand_id, site_id, df, dt)
-    p2 = job_brand_ads_daily(brand_id, site_id, df, dt)
+    # base resolvida antes do pool: os jobs paralelos não sondam as rotas em duplicidade
+    _resolve_brand_base(brand_id, site_id)
+
+    # mesma orquestração do Product Ads: os dailies só dependem da dimensão de
+    # campanhas, então partem assim que o campaign_summary é gravado.
+    # com GOOGLE_APPSCRIPT_BATCH, os uploads dos quatro jobs saem num único POST no fim
+    with batch_uploads(), ThreadPoolExecutor(max_workers=PIPELINE_WORKERS) as executor:
+        f3 = executor.submit(job_brand_campaigns_summary, brand_id, site_id)
+        f4 = executor.submit(job_brand_ads_summary, brand_id, site_id)
+        p3 = f3.result()
+
+        f1 = executor.submit(job_brand_campaigns_daily, brand_id, site_id, df, dt)
+        f2 = executor.submit(job_brand_ads_daily, brand_id, site_id, df, dt)
+        p1, p2, p4 = f1.result(), f2.result(), f4.result()
 
     log.info("✔ brand_campaign_summary → %s", p3)
     log.info("✔ brand_ads_summary → %s", p4)
@@ -2,6 +2,7 @@
 from __future__ import annotations
 import hashlib
 import logging
+import os
 from pathlib import Path
 from collections import defaultdict
 from typing import Dict, List, Iterable, Tuple, Set
@@ -11,85 +12,97 @@ logger = logging.getLogger(__name__)
 
 RAW_DIR = Path("data/raw")
 EXCLUDE_SUFFIXES = (".lock", ".tmp", ".partial")
+HASH_CHUNK_SIZE = 1 << 20  # 1MB por leitura
 
 # -------- utils --------
-def _iter_files(folder: Path) -> Iterable[Path]:
+def _iter_files(folder: Path) -> Iterable[Tuple[Path, os.stat_result]]:
+    """Uma única varredura (scandir): devolve (arquivo, stat) já coletados."""
     if not folder.exists():
-        return []
-    for p in folder.iterdir():
-        try:
-            if p.is_file() and not p.is_symlink() and not p.name.endswith(EXCLUDE_SUFFIXES):
-                yield p
-        except Exception:
-            continue
+        return
+    with os.scandir(folder) as it:
+        for e in it:
+            try:
+                if e.is_file(follow_symlinks=False) and not e.name.endswith(EXCLUDE_SUFFIXES):
+                    yield Path(e.path), e.stat(follow_symlinks=False)
+            except Exception:
+                continue
 
-def hash_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
-    """SHA256 por streaming (1MB/chunk)."""
+def hash_file(path: Path, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """SHA256 por streaming, reaproveitando um único buffer (readinto)."""
     h = hashlib.sha256()
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(chunk_size), b""):
-            h.update(chunk)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with path.open("rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
     return h.hexdigest()
 
 # -------- deteção de duplicados --------
-def find_duplicates(folder: Path) -> tuple[dict[str, list[Path]], dict[str, list[Path]]]:
-
+def find_duplicates(folder: Path, chunk_size: int = HASH_CHUNK_SIZE) -> tuple[dict[str, list[Path]], dict[str, list[Path]], dict[Path, float]]:
     """
-    Retorna (dups_por_nome, dups_por_conteudo).
+    Retorna (dups_por_nome, dups_por_conteudo, mtimes).
     Conteúdo: agrupa por tamanho e só então calcula hash (otimiza custo).
+    mtimes: {arquivo: st_mtime} da mesma varredura — repasse ao cleanup_duplicates
+    para escolher o mantido sem novo stat.
     """
     if not folder.exists():
         logger.error("❌ Pasta %s não encontrada.", folder)
-        return {}, {}
-
-    files = list(_iter_files(folder))
-    if not files:
-        logger.info("📂 Nenhum arquivo encontrado em %s.", folder)
-        return {}, {}
+        return {}, {}, {}
 
-    # por nome
+    # nome e tamanho numa única passada (stat vem do scandir)
     name_map: Dict[str, List[Path]] = defaultdict(list)
-    for f in files:
+    size_map: Dict[int, List[Path]] = defaultdict(list)
+    mtimes: Dict[Path, float] = {}
+    for f, st in _iter_files(folder):
         name_map[f.name].append(f)
-    name_dups = {k: v for k, v in name_map.items() if len(v) > 1}
+        size_map[st.st_size].append(f)
+        mtimes[f] = st.st_mtime
 
-    # por conteúdo (apenas se mesmo tamanho)
-    size_map: Dict[int, List[Path]] = defaultdict(list)
-    for f in files:
-        try:
-            size_map[f.stat().st_size].append(f)
-        except Exception:
-            continue
+    if not name_map:
+        logger.info("📂 Nenhum arquivo encontrado em %s.", folder)
+        return {}, {}, mtimes
+
+    name_dups = {k: v for k, v in name_map.items() if len(v) > 1}
 
+    # por conteúdo: só hasheia grupos de mesmo tamanho (>0 bytes)
     hash_map: Dict[str, List[Path]] = defaultdict(list)
     for size, group in size_map.items():
-        if len(group) < 2:
+        if size == 0 or len(group) < 2:
             continue
         for f in group:
             try:
-                h = hash_file(f)
+                h = hash_file(f, chunk_size)
                 hash_map[h].append(f)
             except Exception as e:
                 logger.warning("⚠️ Falha ao hashear %s: %s", f.name, e)
     content_dups = {k: v for k, v in hash_map.items() if len(v) > 1}
 
-    return name_dups, content_dups
+    return name_dups, content_dups, mtimes
 
 # -------- remoção --------
-def _choose_keep(paths: List[Path], keep_strategy: str = "newest") -> Tuple[Path, List[Path]]:
+def _choose_keep(paths: List[Path], keep_strategy: str = "newest",
+                 mtimes: Dict[Path, float] | None = None) -> Tuple[Path, List[Path]]:
     """
     keep_strategy: 'newest' (mais novo) ou 'oldest' (mais antigo).
+    mtimes: {arquivo: st_mtime} já coletado (find_duplicates); quem faltar leva um stat.
     """
-    reverse = (keep_strategy == "newest")
-    ordered = sorted(paths, key=lambda p: p.stat().st_mtime, reverse=reverse)
-    return ordered[0], ordered[1:]
+    mtimes = mtimes or {}
+    pairs = [(p, mtimes[p] if p in mtimes else p.stat().st_mtime) for p in paths]
+    pick = max if keep_strategy == "newest" else min
+    keep = pick(pairs, key=lambda t: t[1])[0]
+    return keep, [p for p, _ in pairs if p is not keep]
 
 def cleanup_duplicates(dups_dict: Dict[str, List[Path]], mode: str,
                        *, dry_run: bool = False, keep_strategy: str = "newest",
-                       already_removed: Set[Path] | None = None) -> int:
+                       already_removed: Set[Path] | None = None,
+                       mtimes: Dict[Path, float] | None = None) -> int:
     """
     Remove duplicados mantendo um (por grupo). Evita remover duas vezes
     quando o mesmo arquivo aparece em múltiplos grupos (nome+conteúdo).
+    mtimes: mapa devolvido pelo find_duplicates (opcional).
     """
     removed = 0
     already_removed = already_removed or set()
@@ -100,7 +113,7 @@ def cleanup_duplicates(dups_dict: Dict[str, List[Path]], mode: str,
         if len(paths) < 2:
             continue
 
-        keep, to_remove = _choose_keep(paths, keep_strategy)
+        keep, to_remove = _choose_keep(paths, keep_strategy, mtimes)
         logger.info("🧩 Duplicados por %s — mantendo: %s", mode, keep.name)
         for r in to_remove:
             if r in already_removed:
@@ -124,13 +137,15 @@ def main():
     parser.add_argument("--dry-run", action="store_true", help="Apenas simula; não remove nada.")
     parser.add_argument("--keep", choices=("newest", "oldest"), default="newest")
     parser.add_argument("--mode", choices=("all", "name", "content"), default="all")
+    parser.add_argument("--chunk-size", type=int, default=HASH_CHUNK_SIZE,
+                        help="Bytes lidos por vez ao calcular o hash (padrão 1MB).")
     args = parser.parse_args()
 
     # logging básico só quando rodar via CLI
     logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 
     folder = Path(args.folder)
-    name_dups, content_dups = find_duplicates(folder)
+    name_dups, content_dups, mtimes = find_duplicates(folder, args.chunk_size)
     if not name_dups and not content_dups:
         logger.info("✅ Nenhum duplicado encontrado.")
         return
@@ -148,10 +163,12 @@ def main():
 
     if args.mode in {"all", "name"}:
         removed_total += cleanup_duplicates(name_dups, "nome", dry_run=args.dry_run,
-                                            keep_strategy=args.keep, already_removed=already_removed)
+                                            keep_strategy=args.keep, already_removed=already_removed,
+                                            mtimes=mtimes)
     if args.mode in {"all", "content"}:
         removed_total += cleanup_duplicates(content_dups, "conteúdo", dry_run=args.dry_run,
-                                            keep_strategy=args.keep, already_removed=already_removed)
+                                            keep_strategy=args.keep, already_removed=already_removed,
+                                            mtimes=mtimes)
 
     logger.info("✅ Limpeza concluída: %d arquivo(s) removido(s).", removed_total)
 
@@ -13,13 +13,12 @@ DOTENV_PATH = ROOT_DIR / ".env"
 # Carrega .env explicitamente (env do sistema continua tendo precedência, override=False)
 load_dotenv(dotenv_path=str(DOTENV_PATH), override=False)
 
+# Snapshot do ambiente (já com o .env aplicado): strip feito uma única vez
+_ENV = {k: v.strip() for k, v in os.environ.items() if v and v.strip()}
+
 def _env_any(*keys: str, default: str | None = None):
     """Lê a primeira variável disponível entre várias chaves alternativas."""
-    for k in keys:
-        v = os.getenv(k)
-        if v is not None and str(v).strip() != "":
-            return v.strip()
-    return default
+    return next((_ENV[k] for k in keys if k in _ENV), default)
 
 def _warn_missing(name: str, value):
     if not value:
@@ -46,14 +45,17 @@ GOOGLE_APPSCRIPT_TOKEN = _env_any("GOOGLE_APPSCRIPT_TOKEN")
 LOG_LEVEL = _env_any("LOG_LEVEL", default="INFO")
 
 # --- Paths auxiliares ---
-RAW_DIR = str(ROOT_DIR / "data" / "raw")
-LOG_DIR = str(ROOT_DIR / "data" / "logs")
-PROCESSED_DIR = str(ROOT_DIR / "data" / "processed")
+DATA_ROOT = ROOT_DIR / "data"
+RAW_PATH = DATA_ROOT / "raw"
+LOG_PATH = DATA_ROOT / "logs"
+PROCESSED_PATH = DATA_ROOT / "processed"
+RAW_DIR = str(RAW_PATH)
+LOG_DIR = str(LOG_PATH)
+PROCESSED_DIR = str(PROCESSED_PATH)
 
 def ensure_dirs(create: bool = True):
     """Garante que diretórios de trabalho existam."""
-    for p in (RAW_DIR, LOG_DIR, PROCESSED_DIR):
-        path = Path(p)
+    for path in (RAW_PATH, LOG_PATH, PROCESSED_PATH):
         if create:
             path.mkdir(parents=True, exist_ok=True)
 
@@ -4,50 +4,90 @@ import csv
 import os
 import time
 import tempfile
-import shutil
 from pathlib import Path
 from typing import Dict, Any, Iterable, List, Tuple, Optional, Callable
 
+try:  # POSIX
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:  # pyarrow é opcional: só o upsert_table depende dele
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pac
+except ImportError:
+    pa = pc = pac = None
+
+# buffer de escrita (1MB): menos syscalls write() ao gravar CSVs grandes
+WRITE_BUFFER = 1 << 20
+
+# fsync do tmp antes do os.replace (opt-in, mesma flag do report_utils):
+# o CSV novo sobrevive a queda de energia/kernel, ao custo de uma espera de disco
+CSV_FSYNC = os.getenv("CSV_FSYNC", "").strip() in ("1", "true", "True")
+
 # ----------------------------
 # utilidades internas
 # ----------------------------
 def _ensure_parent(path: str | Path) -> None:
     Path(path).parent.mkdir(parents=True, exist_ok=True)
 
-def _row_key(row: Dict[str, Any], key_fields: Iterable[str]) -> Tuple[str, ...]:
-    out: List[str] = []
-    for k in key_fields:
-        v = row.get(k, "")
-        out.append("" if v is None else str(v))
-    return tuple(out)
+def _sync(f) -> None:
+    """Com CSV_FSYNC, força os bytes do arquivo aberto para o disco."""
+    if CSV_FSYNC:
+        f.flush()
+        os.fsync(f.fileno())
+
+def _row_key(row: Dict[str, Any], key_fields: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple("" if v is None else str(v) for v in map(row.get, key_fields))
 
 class _FileLock:
-    """Lock ingênuo baseado em arquivo .lock ao lado do CSV (best-effort)."""
+    """
+    Lock exclusivo via fcntl.flock no arquivo .lock ao lado do CSV (msvcrt.locking no Windows).
+    O kernel solta o lock sozinho se o processo morrer — um .lock remanescente não trava
+    ninguém. Sem disputa o lock sai na primeira tentativa; com disputa, tenta de novo a
+    cada poll_s e levanta TimeoutError depois de timeout_s.
+    """
     def __init__(self, path: str | Path, timeout_s: float = 30.0, poll_s: float = 0.1):
         self.lock_path = f"{str(path)}.lock"
         self.timeout_s = timeout_s
         self.poll_s = poll_s
-        self.acquired = False
+        self.fd: Optional[int] = None
 
     def __enter__(self):
-        start = time.time()
-        while True:
-            try:
-                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-                os.close(fd)
-                self.acquired = True
-                return self
-            except FileExistsError:
-                if time.time() - start > self.timeout_s:
-                    raise TimeoutError(f"Timeout aguardando lock: {self.lock_path}")
-                time.sleep(self.poll_s)
+        fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            deadline = time.monotonic() + self.timeout_s
+            while True:
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    else:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:  # ocupado (BlockingIOError no POSIX)
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Timeout aguardando lock: {self.lock_path}")
+                    time.sleep(self.poll_s)
+        except BaseException:
+            os.close(fd)
+            raise
+        self.fd = fd
+        return self
 
     def __exit__(self, exc_type, exc, tb):
-        if self.acquired and os.path.exists(self.lock_path):
-            try:
-                os.remove(self.lock_path)
-            except FileNotFoundError:
-                pass
+        if self.fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+            self.fd = None
 
 # ----------------------------
 # upsert principal
@@ -76,111 +116,294 @@ def upsert_csv(
             - allow_new_columns=False => header = chaves do primeiro row
             - allow_new_columns=True  => idem; nas próximas chamadas pode expandir.
     - Nunca cria um novo arquivo "com timestamp": sempre sobrescreve o arquivo alvo.
+    - Sem sort_key/drop_fields/strict_header (e com atomic=True), o arquivo atual é
+      reescrito em streaming: só as linhas recebidas ficam em memória.
     """
     path = str(path)
+    key_fields = tuple(key_fields)  # congelado uma vez: reusado em todas as linhas
     _ensure_parent(path)
 
     lock_ctx = _FileLock(path, timeout_s=lock_timeout_s) if atomic else None
     if lock_ctx:
         lock_ctx.__enter__()
 
+    src = None
     try:
-        existing: List[Dict[str, Any]] = []
+        existing: List[List[Any]] = []
         header: List[str] = []
         idx: Dict[Tuple[str, ...], int] = {}
 
-        # 1) leitura do arquivo atual (se existir)
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8", newline="") as f:
-                r = csv.DictReader(f)
-                header = list(r.fieldnames or [])
-                for i, row in enumerate(r):
-                    row = dict(row)
-                    existing.append(row)
-                    idx[_row_key(row, key_fields)] = i
-
-        # 2) definir header alvo
+        # 1) header do arquivo atual (se existir); as linhas são lidas depois
+        file_header: List[str] = []
+        try:
+            src = open(path, "r", encoding="utf-8", newline="")
+        except FileNotFoundError:
+            pass
+        else:
+            reader = csv.reader(src)
+            file_header = next(reader, [])
+        header = list(file_header)
+
+        # 2) definir header alvo (as linhas recebidas são materializadas uma única vez)
+        incoming_list = rows if isinstance(rows, list) else list(rows)
         if schema:
             header = list(schema)
-        else:
-            if not header:
-                rows_iter = iter(rows)
-                boot_rows = list(rows_iter)
-                if not boot_rows:
-                    return path
-                first = boot_rows[0]
-                header = list(first.keys())
-                rows = boot_rows
-
-            if allow_new_columns:
-                seen = set(header)
-                def _union_cols(cols: Iterable[str]):
-                    nonlocal header, seen
-                    for c in cols:
-                        if c not in seen:
-                            seen.add(c)
-                            header.append(c)
-            else:
-                def _union_cols(cols: Iterable[str]):
-                    return
+        elif not header:
+            if not incoming_list:
+                return path
+            header = list(incoming_list[0].keys())
 
-        # 3) aplicar upserts
-        incoming_list = list(rows)
+        # união de colunas só quando o header não está congelado
         if not schema and allow_new_columns:
+            seen = set(header)
             for row in incoming_list:
-                _union_cols(row.keys())
+                for c in row.keys():
+                    if c not in seen:
+                        seen.add(c)
+                        header.append(c)
 
+        # posições (no arquivo) das colunas do header alvo e das chaves
+        n_cols = len(header)
+        fpos = {c: i for i, c in enumerate(file_header)}
+        src_pos = None if header == file_header else [fpos.get(c, -1) for c in header]
+        key_pos = [fpos.get(k, -1) for k in key_fields]
+
+        # dirty: algo mudou em relação ao arquivo atual (senão a reescrita é pulada)
+        dirty = src is None or src_pos is not None
+
+        def _fit(row: List[str]) -> List[Any]:
+            nonlocal dirty
+            # reposiciona a linha lida para o header alvo (colunas fora dele saem)
+            if src_pos is not None:
+                n_row = len(row)
+                return [row[i] if 0 <= i < n_row else "" for i in src_pos]
+            if len(row) != n_cols:
+                dirty = True
+                del row[n_cols:]
+                row.extend([""] * (n_cols - len(row)))
+            return row
+
+        def _file_key(row: List[str]) -> Tuple[str, ...]:
+            n_row = len(row)
+            return tuple(row[i] if 0 <= i < n_row else "" for i in key_pos)
+
+        # 3a) caminho streaming: sem ordenação/drop/header estrito, o arquivo antigo
+        #     é copiado linha a linha para o temporário e só os upserts ficam em RAM
+        if src is not None and atomic and not (sort_key or drop_fields or strict_header):
+            if not incoming_list and not dirty:
+                return path
+            incoming: Dict[Tuple[str, ...], List[Any]] = {}
+            for row in incoming_list:
+                k = _row_key(row, key_fields)
+                target = incoming.get(k)
+                if target is not None:
+                    for i, c in enumerate(header):
+                        val = row.get(c, None)
+                        if val not in ("", None):
+                            target[i] = val
+                else:
+                    incoming[k] = [row.get(c, "") for c in header]
+
+            def _merge_stream():
+                nonlocal dirty
+                for row in reader:
+                    if not row:
+                        continue
+                    upd = incoming.pop(_file_key(row), None) if incoming else None
+                    row = _fit(row)
+                    if upd is not None:
+                        for i, val in enumerate(upd):
+                            if val not in ("", None) and row[i] != str(val):
+                                row[i] = val
+                                dirty = True
+                    yield row
+
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + "_", suffix=".tmp")
+            os.close(fd)
+            with open(tmp, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER) as f:
+                w = csv.writer(f)
+                w.writerow(header)
+                w.writerows(_merge_stream())  # laço externo no C do módulo csv
+                if incoming:
+                    dirty = True
+                    w.writerows(incoming.values())
+                if dirty:
+                    _sync(f)
+            src.close()
+            if dirty:
+                os.replace(tmp, path)  # rename atômico (tmp no mesmo diretório)
+            else:
+                os.remove(tmp)  # nada mudou: mantém o arquivo original intacto
+            return path
+
+        # 3b) caminho bufferizado: carrega as linhas atuais e aplica upserts
+        if src is not None:
+            for row in reader:
+                if not row:
+                    continue
+                idx[_file_key(row)] = len(existing)
+                existing.append(_fit(row))
+            src.close()
+
+        # colunas "presentes" (para strict_header): do arquivo, das linhas novas e das tocadas
+        present = set(file_header) if existing else set()
         for row in incoming_list:
             k = _row_key(row, key_fields)
-            if k in idx:
-                for c in header:
+            pos = idx.get(k)
+            if pos is not None:
+                target = existing[pos]
+                for i, c in enumerate(header):
                     val = row.get(c, None)
                     if val not in ("", None):
-                        existing[idx[k]][c] = val
+                        present.add(c)
+                        if target[i] != str(val):
+                            target[i] = val
+                            dirty = True
             else:
-                new_row = {c: row.get(c, "") for c in header}
                 idx[k] = len(existing)
-                existing.append(new_row)
+                existing.append([row.get(c, "") for c in header])
+                present.update(header)
+                dirty = True
 
         # 4) drop_fields opcional
-        if drop_fields:
-            drop_fields = tuple(drop_fields)
+        drop = set(drop_fields or ())
+        if drop:
+            drop_pos = [i for i, c in enumerate(header) if c in drop]
             for row in existing:
-                for f in drop_fields:
-                    row.pop(f, None)
+                for i in drop_pos:
+                    if row[i] != "":
+                        row[i] = ""
+                        dirty = True
 
         # 5) header estrito
         if strict_header and not schema:
-            keys = []
-            seen = set()
-            for row in existing:
-                for k in row.keys():
-                    if k not in seen:
-                        seen.add(k)
-                        keys.append(k)
-            header = keys
+            keep_pos = [i for i, c in enumerate(header) if c in present and c not in drop]
+            if len(keep_pos) != n_cols:
+                header = [header[i] for i in keep_pos]
+                existing = [[row[i] for i in keep_pos] for row in existing]
+                dirty = True
 
         # 6) ordenar
         if sort_key:
-            existing.sort(key=sort_key)
+            ordered = sorted(existing, key=lambda row: sort_key(dict(zip(header, row))))
+            if not dirty and any(a is not b for a, b in zip(ordered, existing)):
+                dirty = True
+            existing = ordered
+
+        # upsert sem mudanças: o arquivo atual já está correto
+        if not dirty:
+            return path
 
         # 7) escrita
         if atomic:
-            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + "_", suffix=".tmp")
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + "_", suffix=".tmp")
             os.close(fd)
-            with open(tmp, "w", encoding="utf-8", newline="") as f:
-                w = csv.DictWriter(f, fieldnames=header)
-                w.writeheader()
-                for row in existing:
-                    w.writerow({c: row.get(c, "") for c in header})
-            shutil.move(tmp, path)
+            with open(tmp, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER) as f:
+                w = csv.writer(f)
+                w.writerow(header)
+                w.writerows(existing)
+                _sync(f)
+            os.replace(tmp, path)  # rename atômico (tmp no mesmo diretório)
+        else:
+            with open(path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER) as f:
+                w = csv.writer(f)
+                w.writerow(header)
+                w.writerows(existing)
+
+        return path
+
+    finally:
+        if src is not None:
+            src.close()
+        if lock_ctx:
+            lock_ctx.__exit__(None, None, None)
+
+# ----------------------------
+# upsert colunar (pyarrow)
+# ----------------------------
+def upsert_table(
+    path: str | Path,
+    table: "pa.Table",
+    key_fields: Iterable[str],
+    *,
+    atomic: bool = True,
+    lock_timeout_s: float = 30.0,
+) -> str:
+    """
+    Upsert de uma pa.Table inteira em um CSV fixo, sem passar por dicts linha a linha.
+
+    - Lê o CSV atual (todas as colunas como string), concatena com `table` e agrupa
+      por key_fields ficando com o último valor não-nulo de cada coluna.
+    - Colunas novas entram no fim do header; a ordem das chaves segue a 1ª aparição.
+    - Requer pyarrow >= 14 (concat_tables com promote_options); sem ele use upsert_csv.
+    - O lock espera até lock_timeout_s e então levanta TimeoutError.
+    """
+    if pa is None or int(pa.__version__.split(".")[0]) < 14:
+        raise RuntimeError("upsert_table requer pyarrow>=14 (pip install 'pyarrow>=14'); use upsert_csv.")
+    path = str(path)
+    key_fields = list(key_fields)
+    _ensure_parent(path)
+
+    # tudo como string, igual ao que o CSV guarda (e ao que o upsert_csv compara)
+    table = table.cast(pa.schema([pa.field(n, pa.string()) for n in table.schema.names]))
+    # "" vira nulo, como nas linhas lidas do arquivo (strings_can_be_null): assim o "last"
+    # ignora o vazio e mantém o valor antigo — mesma regra do upsert_csv
+    table = pa.table(
+        [pc.if_else(pc.equal(col, ""), pa.scalar(None, pa.string()), col) for col in table.columns],
+        names=table.schema.names,
+    )
+
+    lock_ctx = _FileLock(path, timeout_s=lock_timeout_s) if atomic else None
+    if lock_ctx:
+        lock_ctx.__enter__()
+    try:
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                file_header = next(csv.reader(f), [])
+        except FileNotFoundError:
+            file_header = []
+
+        if file_header:
+            current = pac.read_csv(
+                path,
+                convert_options=pac.ConvertOptions(
+                    column_types={c: pa.string() for c in file_header},
+                    strings_can_be_null=True,
+                ),
+            )
+            combined = pa.concat_tables([current, table], promote_options="default")
         else:
-            with open(path, "w", encoding="utf-8", newline="") as f:
-                w = csv.DictWriter(f, fieldnames=header)
-                w.writeheader()
-                for row in existing:
-                    w.writerow({c: row.get(c, "") for c in header})
+            combined = table
+        if combined.num_rows == 0:
+            return path
+
+        names = combined.schema.names
+        values = [c for c in names if c not in key_fields]
+        # use_threads=False: saída determinística, na ordem de 1ª aparição das chaves
+        grouped = combined.group_by(key_fields, use_threads=False).aggregate([(c, "last") for c in values])
+        out = grouped.select([f"{c}_last" if c in values else c for c in names]).rename_columns(names)
+
+        # escrita pelo módulo csv (aspas só onde precisa, None → ""), no mesmo formato do
+        # upsert_csv: o writer do Arrow poria aspas em toda célula string e no header
+        def _write(f) -> None:
+            w = csv.writer(f)
+            w.writerow(names)
+            w.writerows(zip(*[col.to_pylist() for col in out.columns]))
 
+        if atomic:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + "_", suffix=".tmp")
+            os.close(fd)
+            try:
+                with open(tmp, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER) as f:
+                    _write(f)
+                    _sync(f)
+                os.replace(tmp, path)  # rename atômico (tmp no mesmo diretório)
+            except BaseException:
+                os.remove(tmp)  # falha na escrita: não deixa o temporário para trás
+                raise
+        else:
+            with open(path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER) as f:
+                _write(f)
         return path
 
     finally:
@@ -1,23 +1,59 @@
 # src/daily_update.py
 import os
+import csv
 import logging
 import pandas as pd
 from pathlib import Path
 from datetime import date
 from src.jobs import enviar_para_google_sheets
-from src.csv_utils import upsert_csv  # opcional, ver nota
+from src.csv_utils import upsert_table  # opcional, ver nota
+
+try:  # pyarrow é opcional: acelera leitura/escrita; sem ele, cai no pandas puro
+    import pyarrow as pa
+    import pyarrow.csv as pac
+except ImportError:
+    pa = pac = None
 
 ADS_PATH    = "data/processed/ads_daily.csv"          # alinhe com o padrão do pipeline
 ORDERS_PATH = "data/processed/orders_daily.csv"
 MERGED_PATH = "data/processed/merged_product_daily.csv"
 
+ARROW_BLOCK_SIZE = 16 << 20  # 16 MiB por bloco de parse
+DATE_FMT = "%Y-%m-%d"        # datas do pipeline são ISO (YYYY-MM-DD)
+
 log = logging.getLogger("daily_update")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 
 def load_or_empty(path: str, parse_dates=None):
     if not os.path.exists(path):
         return pd.DataFrame()
-    return pd.read_csv(path, dtype=str, parse_dates=parse_dates or [])
+    if pac is None:
+        df = pd.read_csv(path, dtype=str)
+    else:
+        # força todas as colunas como string (equivalente ao dtype=str do pandas)
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            cols = next(csv.reader(f), [])
+        if not cols:
+            return pd.DataFrame()
+        table = pac.read_csv(
+            path,
+            read_options=pac.ReadOptions(block_size=ARROW_BLOCK_SIZE),
+            convert_options=pac.ConvertOptions(
+                column_types={c: pa.string() for c in cols},
+                strings_can_be_null=True,
+            ),
+        )
+        df = table.to_pandas()
+    # formato fixo → parse vetorizado em C (sem inferência do dateutil)
+    for c in parse_dates or []:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], format=DATE_FMT, errors="coerce")
+    return df
+
+def _write_csv(df: pd.DataFrame, path: str | Path) -> None:
+    # sempre pelo pandas (aspas só onde precisa): o formato do arquivo não pode depender de o
+    # pyarrow estar instalado — o writer do Arrow põe aspas em toda célula string e no header
+    df.to_csv(path, index=False, encoding="utf-8", lineterminator="\n", date_format=DATE_FMT)
 
 def update_daily_data():
     ads    = load_or_empty(ADS_PATH, parse_dates=["date"] if Path(ADS_PATH).exists() else [])
@@ -42,19 +78,25 @@ def update_daily_data():
             break
 
     if left_on and right_on:
-        merged = pd.merge(ads, orders, how="left", left_on=left_on, right_on=right_on, suffixes=("", "_ord"))
+        # indexa orders pela chave uma vez e faz join pelo índice (evita rehash da direita)
+        right = orders.set_index(right_on)
+        # chave única do lado direito → join m:1 (hash); caso contrário assume m:m
+        validate = "m:1" if right.index.is_unique else "m:m"
+        merged = ads.join(right, on=left_on, how="left", rsuffix="_ord", validate=validate)
         log.info("Merge por %s↔%s: ads=%d, orders=%d → merged=%d",
                  left_on, right_on, len(ads), len(orders), len(merged))
     else:
-        merged = ads.copy()
+        merged = ads  # ads não é mais usado depois daqui: sem cópia do DataFrame inteiro
         log.warning("Sem colunas compatíveis para merge — copiando apenas ADS.")
 
     # --- normalização de datas ---
     if "date" in merged.columns:
-        # garante string ISO para CSV/Sheets
-        merged["date"] = pd.to_datetime(merged["date"], errors="coerce").dt.strftime("%Y-%m-%d")
+        # mantém Timestamp; a formatação ISO para CSV/Sheets acontece só na escrita
+        merged["date"] = pd.to_datetime(merged["date"], format=DATE_FMT, errors="coerce")
 
     # --- deduplicação por chaves relevantes ---
+    # linhas inteiras: a primeira ocorrência de cada chave fica como veio do join
+    # (um groupby().first() misturaria colunas de linhas diferentes)
     dedup_keys = [k for k in ("date", "seller_id", "campaign_id", "ad_id", "item_id") if k in merged.columns]
     if dedup_keys:
         before = len(merged)
@@ -66,7 +108,7 @@ def update_daily_data():
     # --- ordenação estável ---
     sort_keys = [k for k in ("seller_id", "campaign_id", "ad_id", "date") if k in merged.columns]
     if sort_keys:
-        merged = merged.sort_values(by=sort_keys, ascending=True)
+        merged = merged.sort_values(by=sort_keys, ascending=True, kind="stable")
 
     # --- gravação atômica ---
     out_dir = Path(MERGED_PATH).parent
@@ -74,14 +116,15 @@ def update_daily_data():
 
     # Opção A: escrita atômica manual
     tmp = out_dir / (Path(MERGED_PATH).name + ".tmp")
-    merged.to_csv(tmp, index=False, encoding="utf-8", line_terminator="\n")
+    _write_csv(merged, tmp)
     os.replace(tmp, MERGED_PATH)
 
-    # Opção B (alternativa): usar upsert_csv com chave (se quiser manter idempotência linha a linha)
-    # from src.csv_utils import upsert_csv
-    # rows = merged.to_dict(orient="records")
-    # upsert_csv(MERGED_PATH, rows, key_fields=dedup_keys or merged.columns.tolist(),
-    #            schema=list(merged.columns), allow_new_columns=False, atomic=True)
+    # Opção B (alternativa): upsert colunar com chave (idempotente, sem to_dict por linha).
+    # Não é o padrão: o merged é recalculado inteiro de ads+orders a cada execução, então
+    # substituir o arquivo é o correto — um upsert manteria linhas que saíram da origem.
+    # if pa is not None:
+    #     upsert_table(MERGED_PATH, pa.Table.from_pandas(merged, preserve_index=False),
+    #                  key_fields=dedup_keys or merged.columns.tolist())
 
     log.info("✅ Atualizado: %s (%d linhas)", MERGED_PATH, len(merged))
 
@@ -3,10 +3,12 @@ from __future__ import annotations
 
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
 from typing import Any, Dict, Optional, Tuple, List
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from src.meli_client import meli_get
 from src.product_ads_endpoints import ENDPOINTS
@@ -15,6 +17,12 @@ logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger("diagnose_ads_routes")
 
 MIN_METRICS = ["prints"]  # métrica leve para validar agregações
+MIN_METRICS_CSV = ",".join(MIN_METRICS)
+MAX_WORKERS = 6           # probes independentes disparados em paralelo
+
+# Sessão única para todo o diagnóstico: reaproveita TCP/TLS entre as chamadas
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS))
 
 def _date_range(days: int = 2) -> Tuple[str, str]:
     days = max(1, min(days, 30))
@@ -52,17 +60,29 @@ def _format_path(template: str, **kwargs) -> str:
     safe_kwargs = {k: v for k, v in kwargs.items() if f"{{{k}}}" in template}
     return template.format(**safe_kwargs)
 
-def _try_get(label: str, path: str, params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
-    # meli_get já loga o GET; aqui apenas reportamos o status/nota
+def _probe(path: str, params: Optional[Dict[str, Any]] = None) -> Tuple[int | str, str, bool, Optional[Dict[str, Any]]]:
+    """GET + decodificação de status: (status, nota, ok, payload). Não imprime nada."""
+    # meli_get já loga o GET; aqui apenas coletamos o status/nota
     try:
-        data = meli_get(path, params=params)
+        data = meli_get(path, params=params, session=SESSION)
         n = len(data.get("results", []) or []) if isinstance(data, dict) else None
-        _pretty(label, 200, (f"results={n}" if n is not None else ""), ok=True)
-        return data if isinstance(data, dict) else None
+        return 200, (f"results={n}" if n is not None else ""), True, (data if isinstance(data, dict) else None)
     except Exception as e:
-        st = _status_from_exc(e) or "ERR"
-        _pretty(label, st, _api_causes(e))
-        return None
+        return (_status_from_exc(e) or "ERR"), _api_causes(e), False, None
+
+def _run_probes(probes: List[Tuple[str, str, Optional[Dict[str, Any]]]]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Dispara (label, path, params) em paralelo e imprime na ordem em que foram listados."""
+    if not probes:
+        return {}
+    # o primeiro vai sozinho: garante o token (e um eventual refresh) antes do paralelo
+    results = [_probe(probes[0][1], probes[0][2])]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        results.extend(ex.map(lambda p: _probe(p[1], p[2]), probes[1:]))
+    out: Dict[str, Optional[Dict[str, Any]]] = {}
+    for (label, _, _), (status, note, ok, data) in zip(probes, results):
+        _pretty(label, status, note, ok=ok)
+        out[label] = data
+    return out
 
 def _first_result_id(payload: Optional[Dict[str, Any]], *keys: str) -> Optional[str]:
     """Extrai um id do primeiro resultado: tenta nested (ex.: r['ad']['id']) e flat (ex.: r['ad_id'])."""
@@ -85,94 +105,84 @@ def _first_result_id(payload: Optional[Dict[str, Any]], *keys: str) -> Optional[
             return str(v)
     return None
 
+def _ad_detail_path(tpl: str, site_id: str, ad_id: str, item_id: Optional[str] = None) -> str:
+    if "{ad_id}" in tpl:
+        return _format_path(tpl, site_id=site_id, ad_id=ad_id)
+    return _format_path(tpl, site_id=site_id, item_id=item_id or ad_id)
+
 def diagnose_routes(advertiser_id: str, site_id: str, days: int,
                     campaign_id: Optional[str], ad_id: Optional[str], item_id: Optional[str]) -> None:
     print("🔍 Testando rotas Product Ads do Mercado Livre\n")
     df, dt = _date_range(days)
 
-    # ---------- campaigns_search ----------
-    # CAMPAIGN (agregado/summary) e DAILY
-    camp_ids: List[str] = []
+    # ---------- fase 1: probes independentes (em paralelo) ----------
+    probes: List[Tuple[str, str, Optional[Dict[str, Any]]]] = []
+
+    # campaigns_search: CAMPAIGN (agregado/summary) e DAILY
+    camp_path = _format_path(ENDPOINTS["campaigns_search"], site_id=site_id, advertiser_id=advertiser_id)
+    camp_labels = []
     for agg in ("CAMPAIGN", "DAILY"):
         label = f"campaigns_search {agg}"
-        path = _format_path(ENDPOINTS["campaigns_search"], site_id=site_id, advertiser_id=advertiser_id)
-        params: Dict[str, Any] = {
+        camp_labels.append(label)
+        probes.append((label, camp_path, {
             "aggregation_type": agg,
             "limit": 1,
-            "metrics": ",".join(MIN_METRICS),
+            "metrics": MIN_METRICS_CSV,
             "date_from": df,
             "date_to": dt,
-        }
-        data = _try_get(label, path, params=params)
-        cid = _first_result_id(data, "campaign.id", "campaign_id", "id")
-        if cid:
-            camp_ids.append(cid)
-
-    # campaign_detail (manual e automático)
-    if "campaign_detail" in ENDPOINTS:
-        # manual (se fornecido)
-        if campaign_id:
-            cpath = _format_path(ENDPOINTS["campaign_detail"], site_id=site_id, campaign_id=campaign_id)
-            _try_get("campaign_detail (manual)", cpath)
-        # automático (do resultado CAMPAIGN)
-        auto_cid = (camp_ids[0] if camp_ids else None)
-        if auto_cid:
-            cpath_auto = _format_path(ENDPOINTS["campaign_detail"], site_id=site_id, campaign_id=auto_cid)
-            _try_get("campaign_detail (auto)", cpath_auto)
-
-    # ---------- ads_search ----------
-    # ITEM (agregado/summary) e DAILY
-    ad_ids: List[str] = []
+        }))
+
+    # campaign_detail (manual, se fornecido)
+    if "campaign_detail" in ENDPOINTS and campaign_id:
+        cpath = _format_path(ENDPOINTS["campaign_detail"], site_id=site_id, campaign_id=campaign_id)
+        probes.append(("campaign_detail (manual)", cpath, None))
+
+    # ads_search: ITEM (agregado/summary) e DAILY
+    ads_path = _format_path(ENDPOINTS["ads_search"], site_id=site_id, advertiser_id=advertiser_id)
+    ads_labels = []
     for agg in ("ITEM", "DAILY"):
         label = f"ads_search {agg}"
-        path = _format_path(ENDPOINTS["ads_search"], site_id=site_id, advertiser_id=advertiser_id)
-        params = {
+        ads_labels.append(label)
+        probes.append((label, ads_path, {
             "aggregation_type": agg,
             "limit": 1,
-            "metrics": ",".join(MIN_METRICS),
+            "metrics": MIN_METRICS_CSV,
             "date_from": df,
             "date_to": dt,
-        }
-        data = _try_get(label, path, params=params)
-        aid = _first_result_id(data, "ad.id", "ad_id", "id")
-        if aid:
-            ad_ids.append(aid)
-
-    # ad_detail (manual e automático)
-    if "ad_detail" in ENDPOINTS:
-        tpl = ENDPOINTS["ad_detail"]
-        # manual
-        if ad_id:
-            if "{ad_id}" in tpl:
-                apath = _format_path(tpl, site_id=site_id, ad_id=ad_id)
-            else:
-                apath = _format_path(tpl, site_id=site_id, item_id=item_id or ad_id)
-            _try_get("ad_detail (manual)", apath)
-        # automático
-        auto_ad = (ad_ids[0] if ad_ids else None)
-        if auto_ad:
-            if "{ad_id}" in tpl:
-                apath_auto = _format_path(tpl, site_id=site_id, ad_id=auto_ad)
-            else:
-                apath_auto = _format_path(tpl, site_id=site_id, item_id=auto_ad)
-            _try_get("ad_detail (auto)", apath_auto)
-
-    # ---------- advertiser_search ----------
-    if "advertiser_search" in ENDPOINTS:
-        # 1) sem site_id (preferível/atual)
-        path1 = "/advertising/advertisers?product_id=PADS"
-        ok1 = _try_get("advertiser_search (no-site)", path1) is not None
+        }))
+
+    # ad_detail (manual)
+    if "ad_detail" in ENDPOINTS and ad_id:
+        probes.append(("ad_detail (manual)", _ad_detail_path(ENDPOINTS["ad_detail"], site_id, ad_id, item_id), None))
 
-        # 2) com site_id (se o template tiver {site_id}) — pode ser 404 em algumas contas
+    # advertiser_search: 1) sem site_id (preferível/atual); 2) com site_id (pode ser 404 em algumas contas)
+    if "advertiser_search" in ENDPOINTS:
+        probes.append(("advertiser_search (no-site)", "/advertising/advertisers?product_id=PADS", None))
         tpl = ENDPOINTS["advertiser_search"]
-        ok2 = False
         if "{site_id}" in tpl:
             path2 = _format_path(tpl, site_id=site_id, advertiser_id=advertiser_id)
-            ok2 = _try_get("advertiser_search (with-site)", path2) is not None
+            probes.append(("advertiser_search (with-site)", path2, None))
 
+    res = _run_probes(probes)
+
+    if "advertiser_search" in ENDPOINTS:
+        ok1 = res.get("advertiser_search (no-site)") is not None
+        ok2 = res.get("advertiser_search (with-site)") is not None
         if not ok1 and not ok2:
             _pretty("advertiser_search", "ERR", "nenhuma variante respondeu")
 
+    # ---------- fase 2: detalhes automáticos (dependem dos ids da fase 1) ----------
+    camp_ids = [cid for cid in (_first_result_id(res.get(l), "campaign.id", "campaign_id", "id") for l in camp_labels) if cid]
+    ad_ids = [aid for aid in (_first_result_id(res.get(l), "ad.id", "ad_id", "id") for l in ads_labels) if aid]
+
+    auto: List[Tuple[str, str, Optional[Dict[str, Any]]]] = []
+    if "campaign_detail" in ENDPOINTS and camp_ids:
+        cpath_auto = _format_path(ENDPOINTS["campaign_detail"], site_id=site_id, campaign_id=camp_ids[0])
+        auto.append(("campaign_detail (auto)", cpath_auto, None))
+    if "ad_detail" in ENDPOINTS and ad_ids:
+        auto.append(("ad_detail (auto)", _ad_detail_path(ENDPOINTS["ad_detail"], site_id, ad_ids[0]), None))
+    _run_probes(auto)
+
     print(f"\n🗓️ Período usado: {df} → {dt} (dias={days})")
     print("ℹ️ Dica: passe --campaign-id/--ad-id para testar detalhes com IDs reais.")
 
@@ -1,27 +1,77 @@
-import os, json, time, logging
-import pandas as pd
+import os, csv, json, time, random, logging, tempfile
+import orjson
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
+from requests.adapters import HTTPAdapter
 
 # Configurações
 SELLER_ID   = os.getenv("MELI_SELLER_ID", "731958")   # pode fixar aqui se quiser
 ACCESS_TOKEN = os.getenv("MELI_ACCESS_TOKEN")          # use variável de ambiente para segurança
 LIMIT       = 50                                       # máximo por página
 OUT_DIR     = "data/raw"
+MAX_WORKERS = 8                                        # páginas buscadas em paralelo
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 4
 
 log = logging.getLogger("fetch_orders")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 
 
+# Colunas do CSV bruto (nomes compatíveis com build_orders_daily.py)
+HEADER = [
+    "id", "date_created", "status", "total_amount", "currency_id",
+    "buyer_id", "item_id", "item_title", "category_name",
+]
+
+
+def _v(x):
+    return "" if x is None else x
+
+
+def _first_item(order):
+    """(item_id, item_title, category_id) do 1º item da order ("" se faltar)."""
+    items = order.get("order_items") or ()
+    item = (items[0].get("item") if items else None) or {}
+    return _v(item.get("id")), _v(item.get("title")), _v(item.get("category_id"))
+
+
+def _flatten_order(o):
+    # extrator explícito: só os caminhos usados no CSV, sem percorrer o JSON inteiro
+    return (
+        _v(o.get("id")), _v(o.get("date_created")), _v(o.get("status")),
+        _v(o.get("total_amount")), _v(o.get("currency_id")),
+        _v((o.get("buyer") or {}).get("id")),
+        *_first_item(o),
+    )
+
+
+# Sessão compartilhada: reaproveita conexões TCP/TLS entre as páginas
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=MAX_WORKERS * 2, pool_maxsize=MAX_WORKERS * 2))
+
+
 def _meli_request(url, params=None):
-    """Executa requisição autenticada à API do Mercado Livre."""
+    """
+    Executa requisição autenticada à API do Mercado Livre.
+    429/5xx: backoff exponencial com jitter até MAX_RETRIES; depois (ou em
+    qualquer outro erro HTTP) levanta requests.HTTPError — o chamador trata como fatal.
+    """
     headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
-    r = requests.get(url, headers=headers, params=params)
-    if r.status_code != 200:
-        log.error("Erro %d em %s: %s", r.status_code, url, r.text)
-        return None
-    return r.json()
+    for attempt in range(MAX_RETRIES + 1):
+        r = session.get(url, headers=headers, params=params, timeout=30)
+        try:
+            r.raise_for_status()
+        except requests.HTTPError:
+            if r.status_code not in RETRY_STATUS or attempt >= MAX_RETRIES:
+                log.error("Erro %d em %s: %s", r.status_code, url, r.text)
+                raise
+            wait = min(0.5 * 2 ** attempt, 10) * random.uniform(0.8, 1.2)
+            log.warning("⚠️ %d em %s — nova tentativa em %.2fs", r.status_code, url, wait)
+            time.sleep(wait)
+            continue
+        return orjson.loads(r.content)
 
 
 def fetch_orders(limit=LIMIT):
@@ -37,56 +87,67 @@ def fetch_orders(limit=LIMIT):
         "offset": 0
     }
 
-    all_orders = []
-    log.info("Iniciando busca de pedidos para seller_id=%s", SELLER_ID)
-
-    while True:
-        data = _meli_request(base_url, params)
-        if not data or "results" not in data:
-            break
-
-        results = data["results"]
-        if not results:
-            break
-
-        all_orders.extend(results)
-        log.info("→ Página offset=%d | Total acumulado: %d", params["offset"], len(all_orders))
+    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    Path(OUT_DIR).mkdir(parents=True, exist_ok=True)
+    out_path = f"{OUT_DIR}/orders_{ts}.csv"
 
-        if len(results) < limit:
-            break  # fim da paginação
-        params["offset"] += limit
-        time.sleep(0.5)
+    total_rows = 0
+    log.info("Iniciando busca de pedidos para seller_id=%s", SELLER_ID)
 
-    if not all_orders:
+    # cada página é achatada e gravada direto no CSV (memória O(página))
+    fd, tmp = tempfile.mkstemp(dir=OUT_DIR, prefix=f"orders_{ts}_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(HEADER)
+
+            # 1ª página: traz o total e define os offsets restantes
+            data = _meli_request(base_url, params)
+            if data.get("results"):
+                w.writerows(_flatten_order(o) for o in data["results"])
+                total_rows += len(data["results"])
+                total = int((data.get("paging") or {}).get("total") or 0)
+                log.info("→ Página offset=0 | Total acumulado: %d (total=%d)", total_rows, total)
+
+                def fetch_page(offset):
+                    return offset, _meli_request(base_url, {**params, "offset": offset})
+
+                full = len(data["results"]) >= limit
+                if total:
+                    offsets = range(limit, total, limit) if full else range(0)
+                    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                        # map preserva a ordem; para na primeira página vazia
+                        for offset, page in executor.map(fetch_page, offsets):
+                            results = page.get("results") or []
+                            if not results:
+                                break
+                            w.writerows(_flatten_order(o) for o in results)
+                            total_rows += len(results)
+                            log.info("→ Página offset=%d | Total acumulado: %d", offset, total_rows)
+                else:
+                    # sem paging.total: pagina em sequência até a primeira página incompleta
+                    offset = limit
+                    while full:
+                        _, page = fetch_page(offset)
+                        results = page.get("results") or []
+                        if not results:
+                            break
+                        w.writerows(_flatten_order(o) for o in results)
+                        total_rows += len(results)
+                        log.info("→ Página offset=%d | Total acumulado: %d", offset, total_rows)
+                        full = len(results) >= limit
+                        offset += limit
+    except BaseException:
+        os.remove(tmp)  # erro fatal (HTTP/rede): não deixa CSV parcial para trás
+        raise
+
+    if not total_rows:
+        os.remove(tmp)
         log.warning("Nenhum pedido retornado.")
         return None
 
-    # Normaliza estrutura JSON aninhada em colunas planas
-    df = pd.json_normalize(all_orders)
-
-    # Colunas principais e renomeadas para compatibilidade com build_orders_daily.py
-    rename_cols = {
-        "id": "id",
-        "date_created": "date_created",
-        "status": "status",
-        "total_amount": "total_amount",
-        "currency_id": "currency_id",
-        "buyer.id": "buyer_id",
-        "order_items[0].item.id": "item_id",
-        "order_items[0].item.title": "item_title",
-        "order_items[0].item.category_id": "category_name"
-    }
-
-    cols_exist = [c for c in rename_cols if c in df.columns]
-    df = df[cols_exist].rename(columns=rename_cols)
-
-    # Salva CSV bruto com timestamp
-    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-    Path(OUT_DIR).mkdir(parents=True, exist_ok=True)
-    out_path = f"{OUT_DIR}/orders_{ts}.csv"
-    df.to_csv(out_path, index=False)
-
-    log.info("✅ CSV salvo em: %s (linhas: %d)", out_path, len(df))
+    os.replace(tmp, out_path)
+    log.info("✅ CSV salvo em: %s (linhas: %d)", out_path, total_rows)
     return out_path
 
 
@@ -25,21 +25,23 @@ def cleanup_old_versions(keep_days: int = 7) -> None:
     """
     Mantém apenas os últimos N arquivos versionados de ads_detail_daily por advertiser_id.
     """
-    files = [f for f in os.listdir(PROCESSED_DIR) if PATTERN.match(f)]
+    # agrupa numa única passada: cada nome passa pela regex uma vez só
     by_adv: dict[str, List[str]] = {}
-
-    for fname in files:
+    for fname in os.listdir(PROCESSED_DIR):
         match = PATTERN.match(fname)
         if not match:
             continue
         advertiser_id, date_str = match.groups()
-        by_adv.setdefault(advertiser_id, []).append(date_str)
+        dates = by_adv.get(advertiser_id)
+        if dates is None:
+            by_adv[advertiser_id] = [date_str]
+        else:
+            dates.append(date_str)
 
     for adv_id, dates in by_adv.items():
-        # Ordena por data (mais recentes primeiro)
-        sorted_dates = sorted(dates, reverse=True)
-        to_keep = set(sorted_dates[:keep_days])
-        to_delete = [d for d in sorted_dates if d not in to_keep]
+        # Ordena por data (mais recentes primeiro); o que passa dos N primeiros sai
+        dates.sort(reverse=True)
+        to_delete = dates[keep_days:]
 
         for d in to_delete:
             fname = f"ads_detail_daily_{adv_id}_{d}.csv"
@@ -9,6 +9,7 @@ from datetime import date, timedelta
 from pathlib import Path
 
 from . import jobs  # reaproveita os jobs existentes
+from . import report_utils  # dono do upload (enviar_para_google_sheets)
 
 MAX_DAYS = 90
 
@@ -20,12 +21,12 @@ def _last_n_days(n: int) -> tuple[str, str]:
 
 @contextmanager
 def _no_upload_to_sheets():
-    old = jobs.APPSCRIPT_URL
+    old = report_utils.APPSCRIPT_URL
     try:
-        jobs.APPSCRIPT_URL = ""  # desliga upload só durante o with
+        report_utils.APPSCRIPT_URL = ""  # desliga upload só durante o with
         yield
     finally:
-        jobs.APPSCRIPT_URL = old
+        report_utils.APPSCRIPT_URL = old
 
 def _ensure_parent(p: str | Path) -> None:
     Path(p).parent.mkdir(parents=True, exist_ok=True)
@@ -3,19 +3,53 @@ from __future__ import annotations
 import logging
 import time
 import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from typing import Dict, Optional, Any, Tuple, List
 import pandas as pd
 from pathlib import Path
+import orjson
 import requests
 import os
+from requests.adapters import HTTPAdapter
 
-from src.auth import get_access_token, refresh_access_token
+from src.auth import get_access_token, refresh_access_token, load_tokens
 from src.csv_utils import upsert_csv
 
 BASE_URL = "https://api.mercadolibre.com"
 RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
 DEFAULT_TIMEOUT: Tuple[int, int] = (10, 60)
 
+# Sessão compartilhada (keep-alive): evita um handshake TCP+TLS por chamada.
+# Sem Retry do urllib3 aqui — o retry/backoff (e o refresh em 401) fica no meli_request.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+# Teto de requisições simultâneas à API (somando todos os pools de threads dos jobs):
+# o paralelismo acelera a espera de rede sem estourar o rate limit do Mercado Livre.
+MAX_INFLIGHT = int(os.getenv("MELI_MAX_INFLIGHT", "16"))
+_INFLIGHT = threading.BoundedSemaphore(MAX_INFLIGHT)
+
+# Teto de requisições por segundo (token bucket de capacidade 1); 0 = sem limite.
+MAX_RPS = float(os.getenv("MELI_MAX_RPS", "0"))
+_rate_lock = threading.Lock()
+_next_slot = 0.0
+
+def _throttle() -> None:
+    """Espaça o início das requisições em 1/MAX_RPS s, somando todas as threads."""
+    global _next_slot
+    if MAX_RPS <= 0:
+        return
+    with _rate_lock:
+        now = time.monotonic()
+        slot = max(now, _next_slot)
+        _next_slot = slot + 1.0 / MAX_RPS
+    if slot > now:
+        time.sleep(slot - now)
+
 log = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 
@@ -23,6 +57,44 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(
 # === núcleo de requisições Mercado Livre ========================
 # ===============================================================
 
+def _retry_wait(attempt: int, resp: Optional[requests.Response] = None,
+                base: float = 1.5, cap: float = 30.0) -> float:
+    """
+    Espera antes da próxima tentativa: o Retry-After do servidor (segundos ou data
+    HTTP) quando vier; senão backoff exponencial com full jitter, U(0, min(cap, base^n)).
+    """
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(retry_after)
+                return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(cap, base ** attempt))
+
+
+# Token compartilhado entre as threads dos jobs: o refresh_token do Mercado Livre é de
+# uso único, então só uma thread pode renová-lo; as demais esperam e relêem o tokens.json.
+_token_lock = threading.Lock()
+
+def _current_token() -> str:
+    """get_access_token serializado: quem entra depois do refresh já lê o token novo."""
+    with _token_lock:
+        return get_access_token()
+
+def _refreshed_token(stale: str) -> str:
+    """Refresh após 401. Se outra thread já trocou o token, usa o dela sem novo refresh."""
+    with _token_lock:
+        current = (load_tokens() or {}).get("access_token")
+        if current and current != stale:
+            return current
+        refresh_access_token()
+        return get_access_token()
+
+
 def _is_advertising_route(path_or_url: str) -> bool:
     return "/advertising/" in path_or_url
 
@@ -44,13 +116,17 @@ def meli_request(
     timeout: Tuple[int, int] | int = DEFAULT_TIMEOUT,
     max_retries: int = 3,
     backoff_base: float = 1.5,
+    session: Optional[requests.Session] = None,
 ) -> Any:
-    """Chamada autenticada com retry/backoff + refresh automático em 401."""
+    """
+    Chamada autenticada com retry/backoff + refresh automático em 401.
+    Usa a SESSION do módulo (pool keep-alive); `session` permite injetar outra.
+    """
     url = _build_url(path)
     attempt = 0
     did_refresh = False
 
-    access_token = get_access_token()
+    access_token = _current_token()
     merged_headers: Dict[str, str] = {
         "Authorization": f"Bearer {access_token}",
         "Accept": "application/json",
@@ -61,33 +137,34 @@ def meli_request(
         merged_headers.update(headers)
 
     safe_params = {k: ("" if v is None else str(v)) for k, v in (params or {}).items()}
+    http = session or SESSION
 
     while True:
         attempt += 1
         log.info("➡️ %s %s", method.upper(), url)
         try:
-            resp = requests.request(
-                method=method.upper(),
-                url=url,
-                headers=merged_headers,
-                params=safe_params,
-                json=json,
-                data=data,
-                timeout=timeout,
-            )
+            # o slot vale só durante a chamada: o sleep do backoff/throttle não ocupa vaga
+            _throttle()
+            with _INFLIGHT:
+                resp = http.request(
+                    method=method.upper(),
+                    url=url,
+                    headers=merged_headers,
+                    params=safe_params,
+                    json=json,
+                    data=data,
+                    timeout=timeout,
+                )
 
             if resp.status_code == 401 and not did_refresh:
                 log.warning("🔒 401 recebido — tentando refresh do token…")
-                refresh_access_token()
-                new_token = get_access_token()
-                merged_headers["Authorization"] = f"Bearer {new_token}"
+                access_token = _refreshed_token(access_token)
+                merged_headers["Authorization"] = f"Bearer {access_token}"
                 did_refresh = True
                 continue
 
             if resp.status_code in RETRY_STATUS and attempt <= max_retries:
-                retry_after = resp.headers.get("Retry-After")
-                wait = float(retry_after) if retry_after else backoff_base ** (attempt - 1)
-                wait *= random.uniform(0.8, 1.2)
+                wait = _retry_wait(attempt, resp, backoff_base)
                 log.warning(
                     "⚠️ %s em %s — tentativa %d/%d. Aguardando %.2fs…",
                     resp.status_code, url, attempt, max_retries, wait
@@ -97,13 +174,16 @@ def meli_request(
 
             resp.raise_for_status()
             try:
-                return resp.json()
-            except ValueError:
+                # orjson direto dos bytes: sem decode para str e parse bem mais rápido
+                return orjson.loads(resp.content)
+            except orjson.JSONDecodeError:
                 return resp.text
 
+        except requests.HTTPError:
+            raise  # status não-retentável (4xx etc.): repetir não muda a resposta
         except requests.RequestException as e:
             if attempt <= max_retries:
-                wait = backoff_base ** (attempt - 1) * random.uniform(0.8, 1.2)
+                wait = _retry_wait(attempt, None, backoff_base)
                 log.warning("⚠️ Erro de rede em %s: %s — tentativa %d/%d. Esperando %.2fs…",
                             url, e, attempt, max_retries, wait)
                 time.sleep(wait)
@@ -114,9 +194,11 @@ def meli_request(
 
 def meli_get(path: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None, *,
              timeout: Tuple[int, int] | int = DEFAULT_TIMEOUT,
-             max_retries: int = 3, backoff_base: float = 1.5) -> Any:
+             max_retries: int = 3, backoff_base: float = 1.5,
+             session: Optional[requests.Session] = None) -> Any:
     return meli_request("GET", path, params=params, headers=headers,
-                        timeout=timeout, max_retries=max_retries, backoff_base=backoff_base)
+                        timeout=timeout, max_retries=max_retries, backoff_base=backoff_base,
+                        session=session)
 
 
 def meli_post(path: str, *, params: Optional[Dict[str, Any]] = None,
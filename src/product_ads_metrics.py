@@ -36,12 +36,17 @@ METRICS_ADS: List[str] = [
 # Limite de métricas por request que algumas APIs impõem
 API_METRIC_LIMIT: int = 20
 
+# Conjuntos de validação montados uma vez (não a cada chamada)
+_ALLOWED_CAMPAIGN = frozenset(METRICS_CAMPAIGN)
+_ALLOWED_ADS = frozenset(METRICS_ADS)
+_ALLOWED_ANY = _ALLOWED_CAMPAIGN | _ALLOWED_ADS
+
 
 def validate_metrics_any(metrics: Iterable[str]) -> List[str]:
     """
     Valida contra o conjunto total (campanha ∪ anúncio).
     """
-    allowed = set(METRICS_CAMPAIGN) | set(METRICS_ADS)
+    allowed = _ALLOWED_ANY
     metrics = list(metrics)
     missing = [m for m in metrics if m not in allowed]
     if missing:
@@ -57,9 +62,9 @@ def validate_metrics_for(level: str, metrics: Iterable[str]) -> List[str]:
     """
     metrics = list(metrics)
     if level.lower() == "campaign":
-        allowed = set(METRICS_CAMPAIGN)
+        allowed = _ALLOWED_CAMPAIGN
     elif level.lower() == "ads":
-        allowed = set(METRICS_ADS)
+        allowed = _ALLOWED_ADS
     else:
         raise ValueError(f"Nível desconhecido: {level!r} (use 'campaign' ou 'ads')")
 
@@ -3,18 +3,25 @@ from __future__ import annotations
 
 import os
 import csv
-import shutil
+import atexit
+import zlib
+import base64
 import tempfile
 import logging
 import time
-import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Iterable, Tuple
-from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+from functools import lru_cache
+from contextlib import contextmanager
+from operator import itemgetter
+from urllib.parse import SplitResult, urlencode, urlsplit, urlunsplit, parse_qsl
 
+import orjson
 import requests
 
 # Import do cliente de API da sua base
-from .meli_client import meli_get
+from .meli_client import meli_get, SESSION, RETRY_STATUS, _retry_wait
 
 # ---------------------------------------------------------------------
 # Logging e constantes globais
@@ -32,6 +39,17 @@ HDR_V2 = {"Api-Version": "2"}
 # ENV para upload opcional (Google Apps Script)
 APPSCRIPT_URL = os.getenv("GOOGLE_APPSCRIPT_URL", "").strip().strip('"').strip("'")
 APPSCRIPT_TOKEN = os.getenv("GOOGLE_APPSCRIPT_TOKEN", "").strip()
+# Corpo gzip+base64 (CSV comprime 5–10×). Opt-in: o doPost precisa decodificar
+# quando vier ?encoding=gzip+base64 → Utilities.ungzip(newBlob(base64Decode(contents)))
+APPSCRIPT_GZIP = os.getenv("GOOGLE_APPSCRIPT_GZIP", "").strip() in ("1", "true", "True")
+# Abaixo disso o gzip não compensa (cabeçalho + base64 + CPU): o corpo vai cru
+APPSCRIPT_GZIP_MIN_BYTES = int(os.getenv("GOOGLE_APPSCRIPT_GZIP_MIN_BYTES", str(64 << 10)))
+# Formato do corpo enviado: "csv" (padrão) ou "jsonl" (um objeto JSON por linha, ?format=jsonl).
+# Os arquivos em disco continuam CSV — o upsert depende deles; só o upload muda.
+APPSCRIPT_FORMAT = os.getenv("GOOGLE_APPSCRIPT_FORMAT", "csv").strip().lower()
+# Uploads em lote: dentro de batch_uploads() os envios viram um único POST JSON
+# ({"files": [{"sheet", "name", "data"}]}, ?batch=1) ao final. Opt-in: o doPost precisa tratar.
+APPSCRIPT_BATCH = os.getenv("GOOGLE_APPSCRIPT_BATCH", "").strip() in ("1", "true", "True")
 
 # Diretórios de dados
 RAW_DIR = "data/raw"
@@ -41,6 +59,19 @@ DATA_DIR = PROCESSED_DIR  # compatibilidade com código legado
 # Se true, recria CSVs do zero
 RESET_CSVS = os.getenv("RESET_CSVS", "").strip() in ("1", "true", "True")
 
+SEARCH_WORKERS = int(os.getenv("MELI_SEARCH_WORKERS", "8"))  # páginas buscadas em paralelo no search_all
+
+# Tamanho de página pedido à API (MELI_PAGE_SIZE): páginas maiores = menos viagens de rede.
+# Vazio/0 mantém o limit de cada chamada; acima do teto do endpoint a API responde 400.
+PAGE_SIZE = int(os.getenv("MELI_PAGE_SIZE", "0") or 0)
+
+# buffer de leitura/escrita dos CSVs (1MB): menos syscalls read()/write()
+IO_BUFFER = 1 << 20
+
+# fsync do tmp antes do os.replace: o CSV novo sobrevive a queda de energia/kernel.
+# Opt-in (CSV_FSYNC=1) — custa uma espera de disco por arquivo gravado.
+CSV_FSYNC = os.getenv("CSV_FSYNC", "").strip() in ("1", "true", "True")
+
 # Ordem base do cabeçalho; demais colunas seguem em ordem alfabética
 PRIMARY_COL_ORDER = [
     "advertiser_id", "site_id",
@@ -60,6 +91,9 @@ METRICS_DAILY = [
     "direct_units_quantity", "indirect_units_quantity", "units_quantity",
     "direct_amount", "indirect_amount", "total_amount",
 ]
+METRICS_DAILY_CSV = ",".join(METRICS_DAILY)  # valor pronto do parâmetro "metrics"
+# params fixos das buscas DAILY (cada job acrescenta datas e filtros sobre uma cópia)
+DAILY_BASE_PARAMS: Dict[str, Any] = {"metrics": METRICS_DAILY_CSV, "aggregation_type": "DAILY", "limit": 200}
 
 # ---------------------------------------------------------------------
 # Utils de arquivo/CSV
@@ -70,21 +104,35 @@ def _ensure_dir(path: str) -> None:
 def _read_csv(path: str) -> Tuple[List[str], List[Dict[str, Any]]]:
     if not os.path.exists(path):
         return [], []
-    with open(path, "r", encoding="utf-8", newline="") as f:
-        r = csv.DictReader(f)
-        rows = [dict(row) for row in r]
-        return (r.fieldnames or []), rows
+    with open(path, "r", encoding="utf-8", newline="", buffering=IO_BUFFER) as f:
+        r = csv.reader(f)
+        header = next(r, [])
+        rows = [dict(zip(header, row)) for row in r if row]
+        return header, rows
+
+def _sync(f) -> None:
+    """Com CSV_FSYNC, força os bytes do tmp para o disco antes do rename."""
+    if CSV_FSYNC:
+        f.flush()
+        os.fsync(f.fileno())
 
 def _write_atomic(path: str, header: List[str], rows: Iterable[Dict[str, Any]]) -> str:
     _ensure_dir(path)
-    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + "_", suffix=".tmp")
+    # tmp no mesmo diretório do destino: os.replace vira um rename atômico (sem cópia)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + "_", suffix=".tmp")
     os.close(fd)
-    with open(tmp, "w", encoding="utf-8", newline="\n") as f:
-        w = csv.DictWriter(f, fieldnames=header)
-        w.writeheader()
-        for row in rows:
-            w.writerow({k: row.get(k, "") for k in header})
-    shutil.move(tmp, path)
+    try:
+        with open(tmp, "w", encoding="utf-8", newline="\n", buffering=IO_BUFFER) as f:
+            w = csv.writer(f)
+            w.writerow(header)
+            blanks = [""] * len(header)  # default de cada coluna, montado uma vez
+            # map(row.get, header, blanks) ≡ [row.get(k, "") ...], mas iterado em C
+            w.writerows(map(row.get, header, blanks) for row in rows)
+            _sync(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
     return path
 
 def _stable_header_from_rows(
@@ -96,28 +144,261 @@ def _stable_header_from_rows(
     strict=False (default): mantém colunas antigas do arquivo + novas dos rows.
     strict=True: usa SOMENTE as colunas presentes nos rows (não herda cabeçalho antigo).
     """
+    # união das chaves num único set.update em C (sem gerador por linha); vazias saem depois
     keys: set = set()
+    keys.update(*rows)
+    keys.discard("")
+    keys.discard(None)
     if not strict:
         keys.update(existing_header or [])
-    for r in rows:
-        keys.update(k for k in r.keys() if k)
+    return _order_header(keys)
 
+def _order_header(keys: set) -> List[str]:
+    """PRIMARY_COL_ORDER primeiro; demais colunas em ordem alfabética."""
     header: List[str] = [c for c in PRIMARY_COL_ORDER if c in keys]
     remaining = sorted(k for k in keys if k not in header)
     header.extend(remaining)
     return header
 
-def _sort_rows(rows: List[Dict[str, Any]], sort_by: Optional[Tuple[str, ...]]) -> List[Dict[str, Any]]:
+def _row_key(r: Dict[str, Any], key_fields: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Chave de upsert da linha como ela fica gravada no CSV (None vira "", não "None")."""
+    return tuple(["" if (v := r.get(k)) is None else str(v) for k in key_fields])
+
+def _sort_rows(rows: List[Dict[str, Any]], sort_by: Optional[Tuple[str, ...]],
+               *, str_values: bool = False) -> List[Dict[str, Any]]:
     if not sort_by:
         return rows
-    def key_func(r: Dict[str, Any]):
-        return tuple(str(r.get(k, "")) for k in sort_by)
-    return sorted(rows, key=key_func)
+    if str_values:
+        # linhas lidas do CSV (valores já str): chave por itemgetter em C, sem get()/str() por campo
+        try:
+            return sorted(rows, key=itemgetter(*sort_by))
+        except KeyError:
+            pass  # linha curta/sem a coluna: cai no caminho normalizado
+    # mesma normalização da chave (None → ""): a ordem bate com a releitura do arquivo
+    return sorted(rows, key=lambda r: _row_key(r, sort_by))
+
+# Cache do upsert por path: (mtime_ns, size, key_fields, header, linhas por chave).
+# Reusado enquanto o arquivo no disco não mudar — evita re-parsear o CSV inteiro a cada chamada.
+# Limitado aos UPSERT_CACHE_MAX_PATHS paths usados mais recentemente (o scheduler roda por
+# dias: sem limite, as linhas de todo CSV já tocado ficariam em memória para sempre).
+UPSERT_CACHE_MAX_PATHS = int(os.getenv("UPSERT_CACHE_MAX_PATHS", "16"))
+_UPSERT_CACHE: Dict[str, Tuple[int, int, Tuple[str, ...], List[str], Dict[Tuple[str, ...], Dict[str, Any]]]] = {}
+_upsert_cache_lock = threading.Lock()
+
+def _upsert_cache_put(path: str, entry: Tuple[Any, ...]) -> None:
+    """Guarda a entrada como a mais recente e descarta as mais antigas além do limite."""
+    with _upsert_cache_lock:
+        _UPSERT_CACHE.pop(path, None)
+        if UPSERT_CACHE_MAX_PATHS <= 0:
+            return
+        _UPSERT_CACHE[path] = entry
+        while len(_UPSERT_CACHE) > UPSERT_CACHE_MAX_PATHS:
+            del _UPSERT_CACHE[next(iter(_UPSERT_CACHE))]  # dict em ordem de inserção: o 1º é o mais antigo
+
+def _file_sig(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
 
-def write_csv_upsert_flexible(
+def _csv_keyer(key_fields: Tuple[str, ...]):
+    """
+    Chave de uma linha lida do CSV (valores já str) num único itemgetter em C.
+    Linha curta ou sem a coluna → KeyError: quem chama cai no r.get(k, "").
+    """
+    getter = itemgetter(*key_fields)
+    if len(key_fields) == 1:
+        return lambda r: (getter(r),)
+    return getter
+
+def _picker(header: List[str], fields: Iterable[str]):
+    """
+    Extrai `fields` direto da lista crua do csv.reader, sem montar o dict da linha
+    (coluna ausente ou linha curta → "", como o r.get(k, "") do dict equivalente).
+    """
+    pos = {c: i for i, c in enumerate(header)}
+    idx = [pos.get(f) for f in fields]
+
+    def slow(raw: List[str]) -> Tuple[str, ...]:
+        n = len(raw)
+        return tuple([raw[i] if i is not None and i < n else "" for i in idx])
+
+    if not idx or None in idx:
+        return slow
+    getter = itemgetter(*idx)
+    single = len(idx) == 1
+
+    def pick(raw: List[str]) -> Tuple[str, ...]:
+        try:
+            v = getter(raw)
+        except IndexError:
+            return slow(raw)
+        return (v,) if single else v
+    return pick
+
+def _upsert_streaming(
     path: str,
     new_rows: List[Dict[str, Any]],
     key_fields: Tuple[str, ...],
+    drop_fields: Tuple[str, ...],
+    sort_by: Optional[Tuple[str, ...]],
+    fallback_header: Optional[Iterable[str]],
+) -> bool:
+    """
+    Upsert em streaming: só as linhas novas ficam em memória; o CSV atual é lido
+    linha a linha e mesclado direto no temporário. Com sort_by (⊆ key_fields) faz um
+    merge ordenado, assumindo o arquivo já ordenado — se não estiver, desiste (False)
+    sem tocar no destino e o chamador cai no caminho bufferizado.
+    """
+    def key_of(r: Dict[str, Any]) -> Tuple[str, ...]:
+        return _row_key(r, key_fields)
+
+    def sort_of(r: Dict[str, Any]) -> Tuple[str, ...]:
+        return _row_key(r, sort_by)
+
+    pending: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for r in new_rows:
+        k = key_of(r)
+        row = pending.get(k)
+        if row is not None:
+            row.update(r)
+        else:
+            pending[k] = r
+    for r in pending.values():
+        for f in drop_fields:
+            r.pop(f, None)
+
+    # novas em ordem (sorted é estável: empates mantêm a ordem de chegada)
+    new_seq = [(sort_of(r) if sort_by else (), k, r) for k, r in pending.items()]
+    if sort_by:
+        new_seq.sort(key=lambda t: t[0])
+
+    try:
+        src = open(path, "r", encoding="utf-8", newline="", buffering=IO_BUFFER)
+    except FileNotFoundError:
+        src = None
+    try:
+        reader = csv.reader(src) if src is not None else iter(())
+        file_header = next(reader, [])
+        header_old = file_header or list(fallback_header or [])
+        # colunas do arquivo + das novas linhas: conhecido antes de escrever
+        header = _stable_header_from_rows(header_old, list(pending.values()), strict=False)
+
+        # nada a reescrever quando nenhuma chave nova já existe: só anexa no fim
+        if (file_header and header == file_header and not set(drop_fields) & set(file_header)
+                and _try_append(path, header, pending, key_fields, sort_by, new_seq)):
+            return True
+
+        _ensure_dir(path)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + "_", suffix=".tmp")
+        os.close(fd)
+        try:
+            with open(tmp, "w", encoding="utf-8", newline="\n", buffering=IO_BUFFER) as f:
+                w = csv.writer(f)
+                w.writerow(header)
+                blanks = [""] * len(header)
+                j, n = 0, len(new_seq)
+                prev: Optional[Tuple[str, ...]] = None
+                pick_key = _picker(file_header, key_fields)
+                pick_sort = _picker(file_header, sort_by or ())
+                # mesmo header e nada a descartar: linha intocada sai exatamente como entrou
+                as_is = header == file_header and not set(drop_fields) & set(file_header)
+                width = len(file_header)
+                for raw in reader:
+                    if not raw:
+                        continue
+                    if sort_by:
+                        sk = pick_sort(raw)
+                        if prev is not None and sk < prev:
+                            raise _NotSorted()
+                        prev = sk
+                        # novas que vêm antes desta linha (empate: a existente sai primeiro)
+                        while j < n and new_seq[j][0] < sk:
+                            if pending.pop(new_seq[j][1], None) is not None:
+                                w.writerow(map(new_seq[j][2].get, header, blanks))
+                            j += 1
+                    upd = pending.pop(pick_key(raw), None)
+                    if upd is None and as_is and len(raw) == width:
+                        w.writerow(raw)
+                        continue
+                    row = dict(zip(file_header, raw))
+                    if upd is not None:
+                        row.update(upd)
+                    for fld in drop_fields:
+                        row.pop(fld, None)
+                    w.writerow(map(row.get, header, blanks))
+                w.writerows(map(r.get, header, blanks) for _, k, r in new_seq[j:] if k in pending)
+                _sync(f)
+            os.replace(tmp, path)
+        except _NotSorted:
+            os.remove(tmp)
+            return False
+        except BaseException:
+            os.remove(tmp)
+            raise
+    finally:
+        if src is not None:
+            src.close()
+    return True
+
+def _try_append(
+    path: str,
+    header: List[str],
+    pending: Dict[Tuple[str, ...], Dict[str, Any]],
+    key_fields: Tuple[str, ...],
+    sort_by: Optional[Tuple[str, ...]],
+    new_seq: List[Tuple[Tuple[str, ...], Tuple[str, ...], Dict[str, Any]]],
+) -> bool:
+    """
+    Caso só-inserção: se nenhuma chave nova existe no arquivo (e, com sort_by, o
+    arquivo está ordenado e as novas vêm depois da última linha), anexa as novas
+    no fim — mesmo resultado da reescrita, sem regravar o que já está no disco.
+    Lê só as colunas da chave/ordenação; para na primeira sobreposição.
+    """
+    with open(path, "rb") as fb:
+        fb.seek(0, os.SEEK_END)
+        if fb.tell() == 0:
+            return False
+        fb.seek(-1, os.SEEK_END)
+        if fb.read(1) != b"\n":  # última linha sem terminador: anexar a corromperia
+            return False
+
+    pick_key = _picker(header, key_fields)
+    pick_sort = _picker(header, sort_by or ())
+
+    prev: Optional[Tuple[str, ...]] = None
+    with open(path, "r", encoding="utf-8", newline="", buffering=IO_BUFFER) as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for raw in reader:
+            if not raw:
+                continue
+            if pick_key(raw) in pending:
+                return False
+            if sort_by:
+                sk = pick_sort(raw)
+                if prev is not None and sk < prev:
+                    return False
+                prev = sk
+    # empate com a última existente é ok: a reescrita também manteria a existente antes
+    if sort_by and prev is not None and new_seq and new_seq[0][0] < prev:
+        return False
+
+    blanks = [""] * len(header)
+    with open(path, "a", encoding="utf-8", newline="\n", buffering=IO_BUFFER) as f:
+        csv.writer(f).writerows(map(r.get, header, blanks) for _, _, r in new_seq)
+        _sync(f)
+    log.info("➕ Sem sobreposição de chaves — %d linhas anexadas a %s", len(new_seq), path)
+    return True
+
+class _NotSorted(Exception):
+    """Arquivo atual fora da ordem de sort_by: o merge em streaming não se aplica."""
+
+def write_csv_upsert_flexible(
+    path: str,
+    new_rows: Iterable[Dict[str, Any]],
+    key_fields: Tuple[str, ...],
     *,
     strict_header: bool = False,
     drop_fields: Optional[Iterable[str]] = None,
@@ -140,36 +421,103 @@ def write_csv_upsert_flexible(
         except Exception as e:
             log.warning("Não foi possível apagar %s: %s", path, e)
 
-    header_old, existing = _read_csv(path)
+    key_fields = tuple(key_fields)  # congelado uma vez: reusado em todas as chaves
+
+    # retira a entrada do cache: só volta depois de uma escrita bem-sucedida
+    cached = _UPSERT_CACHE.pop(path, None)
+    sig = _file_sig(path)
+    cache_hit = bool(cached and sig and cached[:2] == sig)
+
+    # sem cache válido e sem exigir todas as linhas em memória (header estrito, ou
+    # ordenação por campos fora da chave): merge em streaming, memória O(novas)
+    if not cache_hit and not strict_header and set(sort_by or ()) <= set(key_fields):
+        new_rows = new_rows if isinstance(new_rows, list) else list(new_rows)
+        if _upsert_streaming(path, new_rows, key_fields, tuple(drop_fields or ()), sort_by, fallback_header):
+            log.info("💾 CSV atualizado: %s (+%d linhas novas/atualizadas)", path, len(new_rows))
+            return path
+        log.info("ℹ️ %s fora da ordem de %s — sem merge em streaming.", path, sort_by)
+
+    # uma única estrutura chave → linha (dict preserva a ordem de inserção)
+    merged: Dict[Tuple[str, ...], Dict[str, Any]]
+    if cache_hit:
+        _, _, cached_keys, header_old, merged = cached
+        header_old = list(header_old)
+        if cached_keys != key_fields:
+            merged = {_row_key(r, key_fields): r for r in merged.values()}
+    else:
+        header_old, existing = _read_csv(path)
+        # valores lidos do CSV já são str: a chave sai direto do itemgetter (C),
+        # e só linhas curtas/sem a coluna da chave caem no get com default
+        try:
+            keyer = _csv_keyer(key_fields)
+            merged = {keyer(r): r for r in existing}
+        except KeyError:
+            merged = {tuple([r.get(k, "") for k in key_fields]): r for r in existing}
 
     if not header_old and fallback_header:
         header_old = list(fallback_header)
 
-    index: Dict[Tuple[str, ...], int] = {}
-    for i, r in enumerate(existing):
-        key = tuple(str(r.get(k, "")) for k in key_fields)
-        index[key] = i
-
-    merged = list(existing)
-    for r in new_rows:
-        k = tuple(str(r.get(kf, "")) for kf in key_fields)
-        if k in index:
-            pos = index[k]
-            merged[pos] = {**merged[pos], **r}
+    n_new = 0
+    kf = key_fields
+    lookup = merged.get
+    drop_fields = tuple(drop_fields or ())
+    touched: set = set()  # id() das linhas inseridas/alteradas nesta chamada
+    # colunas vistas nas linhas novas: as existentes já estão todas em header_old
+    new_cols: set = set()
+    for r in new_rows:  # consumido uma única vez: aceita gerador
+        n_new += 1
+        new_cols.update(r.keys())
+        get = r.get
+        k = tuple(["" if (v := get(f)) is None else str(v) for f in kf])
+        row = lookup(k)
+        if row is not None:
+            row.update(r)  # merge in-place, sem copiar a linha
         else:
-            index[k] = len(merged)
-            merged.append(r)
-
-    if drop_fields:
-        drop_fields = tuple(drop_fields)
-        for r in merged:
-            for f in drop_fields:
-                r.pop(f, None)
-
-    merged = _sort_rows(merged, sort_by)
-    header = _stable_header_from_rows(header_old, merged, strict=strict_header)
-    _write_atomic(path, header, merged)
-    log.info("💾 CSV atualizado: %s (+%d linhas novas/atualizadas)", path, len(new_rows))
+            merged[k] = row = r
+        touched.add(id(row))
+        # descarte na mesma passada, com a linha ainda quente
+        for f in drop_fields:
+            row.pop(f, None)
+
+    # linhas intocadas só têm colunas do arquivo: só precisam de descarte se ele as tinha
+    if drop_fields and set(drop_fields) & set(header_old):
+        for r in merged.values():
+            if id(r) not in touched:
+                for f in drop_fields:
+                    r.pop(f, None)
+
+    rows = _sort_rows(list(merged.values()), sort_by)
+    if strict_header:
+        header = _stable_header_from_rows(header_old, rows, strict=True)
+    else:
+        # header incremental: sem re-varrer todas as linhas; campo descartado só
+        # sobrevive se já era coluna do arquivo (como no scan completo)
+        new_cols.difference_update(drop_fields)
+        new_cols.discard("")
+        new_cols.discard(None)
+        header = _order_header(new_cols.union(header_old))
+    _write_atomic(path, header, rows)
+
+    # guarda o estado exatamente como um _read_csv do arquivo recém-escrito o veria
+    sig = _file_sig(path)
+    if sig:
+        # uma passada: normaliza cada linha e calcula a chave dela uma única vez.
+        # Linhas intocadas (do arquivo/cache, header inalterado) já estão só com str:
+        # entram como estão, sem remontar o dict coluna a coluna.
+        reuse = header == header_old and not (drop_fields and set(drop_fields) & set(header))
+        keyer = _csv_keyer(key_fields)
+        by_key: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        for r in rows:
+            if reuse and id(r) not in touched:
+                d = r
+            else:
+                d = {k: ("" if (v := r.get(k)) is None else str(v)) for k in header}
+            try:
+                by_key[keyer(d)] = d
+            except KeyError:
+                by_key[tuple([d.get(k, "") for k in key_fields])] = d
+        _upsert_cache_put(path, (*sig, key_fields, header, by_key))
+    log.info("💾 CSV atualizado: %s (+%d linhas novas/atualizadas)", path, n_new)
     return path
 
 # ---------------------------------------------------------------------
@@ -178,91 +526,302 @@ def write_csv_upsert_flexible(
 def _post_with_retry(url: str, path: str, headers: Dict[str, str], tries: int = 3, base: float = 1.8):
     for a in range(1, tries + 1):
         try:
-            with open(path, "rb") as f:
-                resp = requests.post(url, data=f, headers=headers, timeout=(10, 180))
+            # arquivo aberto como corpo: o http.client já envia em blocos (sem read() inteiro)
+            # e com Content-Length; o buffer grande só junta as leituras pequenas dele
+            with open(path, "rb", buffering=IO_BUFFER) as f:
+                resp = SESSION.post(url, data=f, headers=headers, timeout=(10, 180))
+            if resp.status_code in RETRY_STATUS and a < tries:
+                # 429/5xx: respeita o Retry-After do servidor (ou full jitter)
+                wait = _retry_wait(a, resp, base)
+                log.warning("Retry upload %d/%d em %.2fs: HTTP %s", a, tries, wait, resp.status_code)
+                time.sleep(wait)
+                continue
             resp.raise_for_status()
             return resp
+        except requests.HTTPError:
+            raise
         except requests.RequestException as e:
             if a == tries:
                 raise
-            wait = base ** (a - 1) + random.uniform(0, 0.5)
+            wait = _retry_wait(a, None, base)
             log.warning("Retry upload %d/%d em %.2fs: %s", a, tries, wait, e)
             time.sleep(wait)
 
+def _gzip_b64_tmp(path: str) -> str:
+    """
+    Gera ao lado do CSV um temporário com o conteúdo em gzip+base64, em blocos:
+    nem o CSV nem o corpo comprimido ficam inteiros em memória.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + "_", suffix=".gz.b64")
+    os.close(fd)
+    try:
+        with open(path, "rb") as src, open(tmp, "wb", buffering=IO_BUFFER) as out:
+            gz = zlib.compressobj(5, zlib.DEFLATED, 31)  # wbits=31 → container gzip
+            pending = b""
+            for chunk in iter(lambda: src.read(IO_BUFFER), b""):
+                pending += gz.compress(chunk)
+                cut = len(pending) - len(pending) % 3  # base64 em múltiplos de 3 bytes: sem padding no meio
+                out.write(base64.b64encode(pending[:cut]))
+                pending = pending[cut:]
+            out.write(base64.b64encode(pending + gz.flush()))
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return tmp
+
+def _jsonl_tmp(path: str) -> str:
+    """
+    Converte o CSV em JSONL (um objeto por linha, chaves = header) num temporário
+    ao lado dele, linha a linha: o Apps Script faz split("\\n") + JSON.parse, sem CSV.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + "_", suffix=".jsonl")
+    os.close(fd)
+    try:
+        with open(path, "r", encoding="utf-8", newline="", buffering=IO_BUFFER) as src, \
+                open(tmp, "wb", buffering=IO_BUFFER) as out:
+            reader = csv.reader(src)
+            header = next(reader, [])
+            dumps, write = orjson.dumps, out.write
+            for raw in reader:
+                if raw:
+                    write(dumps(dict(zip(header, raw))))
+                    write(b"\n")
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return tmp
+
+@lru_cache(maxsize=4)
+def _appscript_base(url: str, token: str) -> Tuple[SplitResult, Dict[str, str], str]:
+    """URL base do Apps Script já parseada (+ token) e a versão mascarada para log."""
+    parts = urlsplit(url)
+    q = dict(parse_qsl(parts.query))
+    if token:
+        q["token"] = token
+    return parts, q, urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+# Fila do lote: (caminho, aba) em ordem de chegada, sem repetição; profundidade de
+# batch_uploads() aninhados (pipelines de vários advertisers em paralelo)
+_pending_uploads: Dict[Tuple[str, Optional[str]], None] = {}
+_upload_depth = 0
+_upload_lock = threading.Lock()
+
+@contextmanager
+def batch_uploads():
+    """
+    Adia os enviar_para_google_sheets do bloco e manda tudo num único POST ao sair
+    do bloco mais externo. Sem GOOGLE_APPSCRIPT_BATCH, não faz nada.
+    """
+    global _upload_depth
+    if not APPSCRIPT_BATCH:
+        yield
+        return
+    with _upload_lock:
+        _upload_depth += 1
+    try:
+        yield
+    finally:
+        with _upload_lock:
+            _upload_depth -= 1
+            batch = list(_pending_uploads) if _upload_depth == 0 else []
+            if _upload_depth == 0:
+                _pending_uploads.clear()
+        if batch:
+            _flush_uploads(batch)
+
+def _flush_uploads(batch: List[Tuple[str, Optional[str]]]) -> None:
+    parts, base_q, masked_url = _appscript_base(APPSCRIPT_URL, APPSCRIPT_TOKEN)
+    q = dict(base_q)
+    q["batch"] = "1"
+    jsonl = APPSCRIPT_FORMAT == "jsonl"
+    if jsonl:
+        q["format"] = "jsonl"  # vale para todos os arquivos do lote
+
+    tmps: List[str] = []
+    try:
+        # corpo JSON montado em disco, um arquivo por vez (nunca todos em memória)
+        first = batch[0][0]
+        fd, body_path = tempfile.mkstemp(dir=os.path.dirname(first) or ".", prefix="batch_", suffix=".json")
+        os.close(fd)
+        tmps.append(body_path)
+        with open(body_path, "wb", buffering=IO_BUFFER) as out:
+            out.write(b'{"files":[')
+            for i, (path, sheet) in enumerate(batch):
+                src_path = path
+                if jsonl:
+                    src_path = _jsonl_tmp(path)
+                    tmps.append(src_path)
+                if i:
+                    out.write(b",")
+                # {"sheet":..,"name":..,"data":"<conteúdo>"}: o conteúdo entra em blocos,
+                # cada um escapado como trecho de string JSON (leitura em texto não corta caracteres)
+                out.write(orjson.dumps({"sheet": sheet, "name": os.path.basename(path)})[:-1])
+                out.write(b',"data":"')
+                with open(src_path, "r", encoding="utf-8", newline="") as f:
+                    for chunk in iter(lambda: f.read(IO_BUFFER), ""):
+                        out.write(orjson.dumps(chunk)[1:-1])
+                out.write(b'"}')
+            out.write(b"]}")
+        content_type = "application/json"
+        if APPSCRIPT_GZIP and os.path.getsize(body_path) >= APPSCRIPT_GZIP_MIN_BYTES:
+            body_path = _gzip_b64_tmp(body_path)
+            tmps.append(body_path)
+            content_type = "text/plain; charset=utf-8"
+            q["encoding"] = "gzip+base64"
+        url = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(q), ""))
+        size = os.path.getsize(body_path)
+        headers = {"Content-Type": content_type, "Content-Length": str(size)}
+        log.info("⬆️ Enviando lote de %d arquivos (%s bytes) → %s", len(batch), size, masked_url)
+        resp = _post_with_retry(url, body_path, headers)
+        log.info("✅ Upload em lote OK (%s) – abas %s", resp.status_code, ", ".join(s or "dados" for _, s in batch))
+        return
+    except Exception as e:
+        log.exception("⚠️ Upload em lote falhou (%s) — enviando um a um.", e)
+    finally:
+        for t in tmps:
+            os.remove(t)
+    for path, sheet in batch:
+        _enviar(path, sheet)
+
 def enviar_para_google_sheets(caminho_csv: str, sheet: Optional[str] = None) -> None:
     if not APPSCRIPT_URL:
         log.info("GOOGLE_APPSCRIPT_URL não configurado — pulando upload.")
         return
-
-    parts = urlsplit(APPSCRIPT_URL)
-    q = dict(parse_qsl(parts.query))
-    if APPSCRIPT_TOKEN:
-        q["token"] = APPSCRIPT_TOKEN
+    if APPSCRIPT_BATCH:
+        with _upload_lock:
+            if _upload_depth:
+                _pending_uploads[(caminho_csv, sheet)] = None
+                log.info("🧺 %s na fila do lote (aba %s)", os.path.basename(caminho_csv), sheet or "dados")
+                return
+    _enviar(caminho_csv, sheet)
+
+def _enviar(caminho_csv: str, sheet: Optional[str] = None) -> None:
+    parts, base_q, masked_url = _appscript_base(APPSCRIPT_URL, APPSCRIPT_TOKEN)
+    q = dict(base_q)
     if sheet:
         q["sheet"] = sheet
     name = os.path.basename(caminho_csv)
     q["name"] = name
-    url = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(q), ""))
-
-    masked_url = urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+    jsonl = APPSCRIPT_FORMAT == "jsonl"
+    if jsonl:
+        q["format"] = "jsonl"
 
+    tmps: List[str] = []  # corpos intermediários gerados para este upload
     try:
-        size = os.path.getsize(caminho_csv)
-        headers = {"Content-Type": "text/csv; charset=utf-8", "X-Filename": name}
+        body_path = caminho_csv
+        content_type = "text/csv; charset=utf-8"
+        if jsonl:
+            body_path = _jsonl_tmp(body_path)
+            tmps.append(body_path)
+            content_type = "application/x-ndjson; charset=utf-8"
+        if APPSCRIPT_GZIP and os.path.getsize(body_path) >= APPSCRIPT_GZIP_MIN_BYTES:
+            # o doPost só enxerga o corpo como texto: gzip vai embrulhado em base64
+            body_path = _gzip_b64_tmp(body_path)
+            tmps.append(body_path)
+            content_type = "text/plain; charset=utf-8"
+            q["encoding"] = "gzip+base64"
+        url = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(q), ""))
+        size = os.path.getsize(body_path)
+        headers = {"Content-Type": content_type, "X-Filename": name, "Content-Length": str(size)}
         log.info("⬆️ Enviando %s (%s bytes) → %s", name, size, masked_url)
-        resp = _post_with_retry(url, caminho_csv, headers)
+        resp = _post_with_retry(url, body_path, headers)
         log.info("✅ Upload OK (%s) – aba %s", resp.status_code, sheet or "dados")
     except Exception as e:
         log.exception("❌ Falha no upload ao Apps Script: %s", e)
+    finally:
+        for t in tmps:
+            os.remove(t)
 
 # ---------------------------------------------------------------------
 # HTTP paging helper
 # ---------------------------------------------------------------------
-def search_all(endpoint: str, params: Dict[str, Any], headers: Dict[str, str]) -> List[Dict[str, Any]]:
+def search_all(endpoint: str, params: Dict[str, Any], headers: Dict[str, str],
+               workers: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Faz paginação padrão baseada em limit/offset e concatena results.
+    - workers: páginas buscadas em paralelo (padrão SEARCH_WORKERS). Chamadores que já
+      rodam dentro de um pool passam workers=1 (sequencial) para não aninhar pools.
     """
+    workers = SEARCH_WORKERS if workers is None else workers
     out: List[Dict[str, Any]] = []
-    limit = int(params.get("limit", 200))
-    offset = 0
-    while True:
-        page = meli_get(endpoint, params={**params, "limit": limit, "offset": offset}, headers=headers)
+    limit = PAGE_SIZE or int(params.get("limit", 200))
+    # um único dict de params (meli_get não o altera); só o offset muda entre páginas
+    p = dict(params)
+    p["limit"] = limit
+    p["offset"] = 0
+
+    def consume(offset: int, page: Any) -> bool:
+        """Acumula a página; False quando a paginação termina."""
+        if isinstance(page, list):
+            # algumas rotas devolvem a lista crua (sem paging): é a resposta inteira
+            out.extend(page)
+            return False
         if not isinstance(page, dict):
             log.warning("⚠️ Resposta não-JSON em %s (offset=%s). Encerrando paginação.", endpoint, offset)
-            break
+            return False
         batch = page.get("results", []) or []
         out.extend(batch)
-        if len(batch) < limit:
-            break
-        offset += limit
+        return len(batch) >= limit
+
+    first = meli_get(endpoint, params=p, headers=headers)
+    if not consume(0, first):
+        return out
+
+    total = (first.get("paging") or {}).get("total")
+    if total is None or workers <= 1:
+        # sem paging.total (ou sem paralelismo pedido): segue sequencial
+        offset = limit
+        while True:
+            p["offset"] = offset
+            if not consume(offset, meli_get(endpoint, params=p, headers=headers)):
+                break
+            offset += limit
+        return out
+
+    def fetch(offset: int) -> Any:
+        # páginas em paralelo: cada thread precisa do seu próprio dict
+        return meli_get(endpoint, params={**p, "offset": offset}, headers=headers)
+
+    # com o total em mãos, as páginas restantes saem em paralelo (map preserva a ordem)
+    offsets = range(limit, int(total), limit)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for offset, page in zip(offsets, executor.map(fetch, offsets)):
+            if not consume(offset, page):
+                break
     return out
 
 # ---------------------------------------------------------------------
 # Flatten e metadados básicos
 # ---------------------------------------------------------------------
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+_EMPTY: Dict[str, Any] = {}  # singleton somente-leitura para aninhados ausentes
+
 def _flatten_raw_daily(r: Dict[str, Any]) -> Dict[str, Any]:
     """
     Achata uma linha de 'daily' (se vierem objetos aninhados campaign/ad/item).
     """
-    out: Dict[str, Any] = {k: v for k, v in r.items() if not isinstance(v, (list, dict))}
+    # JSON só produz escalares, list e dict: o filtro por tipos escalares equivale a "não list/dict"
+    out: Dict[str, Any] = {k: v for k, v in r.items() if isinstance(v, _SCALAR_TYPES)}
+    get, rget = out.get, r.get
 
     # normaliza data
-    out["date"] = out.get("date") or r.get("day") or r.get("report_date")
-    if out.get("date"):
-        out["date"] = str(out["date"])[:10]  # YYYY-MM-DD
+    d = get("date") or rget("day") or rget("report_date")
+    out["date"] = str(d)[:10] if d else d  # YYYY-MM-DD
 
     # campos aninhados comuns
-    campaign = r.get("campaign") or {}
-    ad = r.get("ad") or {}
-    item = r.get("item") or {}
-
-    out["campaign_id"] = campaign.get("id") or r.get("campaign_id") or out.get("campaign_id")
-    out["campaign_name"] = campaign.get("name") or r.get("campaign_name") or out.get("campaign_name")
-    out["ad_id"] = ad.get("id") or r.get("ad_id") or out.get("ad_id")
-    out["item_id"] = item.get("id") or r.get("item_id") or out.get("item_id")
-    out["item_title"] = item.get("title") or ad.get("title") or r.get("title") or out.get("item_title")
-    out["seller_sku"] = item.get("seller_sku") or r.get("seller_sku") or out.get("seller_sku")
-    out["status"] = r.get("status") or campaign.get("status") or ad.get("status") or out.get("status")
+    campaign = rget("campaign") or _EMPTY
+    ad = rget("ad") or _EMPTY
+    item = rget("item") or _EMPTY
+
+    # os escalares de r já estão em out: cada campo plano é lido uma única vez
+    out["campaign_id"] = campaign.get("id") or get("campaign_id")
+    out["campaign_name"] = campaign.get("name") or get("campaign_name")
+    out["ad_id"] = ad.get("id") or get("ad_id")
+    out["item_id"] = item.get("id") or get("item_id")
+    out["item_title"] = item.get("title") or ad.get("title") or get("title") or get("item_title")
+    out["seller_sku"] = item.get("seller_sku") or get("seller_sku")
+    status = get("status")
+    out["status"] = status or campaign.get("status") or ad.get("status") or status
     return out
 
 def _with_meta(row: Dict[str, Any], advertiser_id: str, site_id: str) -> Dict[str, Any]:
@@ -270,14 +829,52 @@ def _with_meta(row: Dict[str, Any], advertiser_id: str, site_id: str) -> Dict[st
     row["site_id"] = site_id
     return row
 
-# Cache de nomes de campanhas (para completude eventual)
+# Cache de nomes de campanhas (para completude eventual); compartilhado entre threads.
+# Persistido em JSON entre execuções: campanha já conhecida não gera GET de novo no próximo cron.
+CAMPAIGN_NAME_CACHE_PATH = os.getenv(
+    "CAMPAIGN_NAME_CACHE_PATH", os.path.join(PROCESSED_DIR, ".campaign_name_cache.json")
+).strip()
 _campaign_name_cache: Dict[str, str] = {}
+_campaign_name_lock = threading.Lock()
+_campaign_name_dirty = False
+
+def _load_campaign_names() -> None:
+    if not CAMPAIGN_NAME_CACHE_PATH or RESET_CSVS:
+        return
+    try:
+        with open(CAMPAIGN_NAME_CACHE_PATH, "rb") as f:
+            data = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return
+    if isinstance(data, dict):
+        _campaign_name_cache.update({str(k): str(v) for k, v in data.items() if v})
+
+def _save_campaign_names() -> None:
+    """Grava o cache (tmp + os.replace, atômico) só se algo novo entrou nesta execução."""
+    if not CAMPAIGN_NAME_CACHE_PATH or not _campaign_name_dirty:
+        return
+    with _campaign_name_lock:
+        payload = orjson.dumps(_campaign_name_cache)
+    try:
+        _ensure_dir(CAMPAIGN_NAME_CACHE_PATH)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(CAMPAIGN_NAME_CACHE_PATH) or ".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, CAMPAIGN_NAME_CACHE_PATH)
+    except OSError as e:
+        log.warning("⚠️ Falha ao salvar cache de nomes de campanha: %s", e)
+
+_load_campaign_names()
+atexit.register(_save_campaign_names)
 
 def _fetch_campaign_name(site_id: str, campaign_id: str) -> Optional[str]:
+    global _campaign_name_dirty
     if not campaign_id:
         return None
-    if campaign_id in _campaign_name_cache:
-        return _campaign_name_cache[campaign_id]
+    with _campaign_name_lock:
+        cached = _campaign_name_cache.get(campaign_id)
+    if cached is not None:
+        return cached
     try:
         path = f"/advertising/{site_id}/product_ads/campaigns/{campaign_id}"
         resp = meli_get(path, headers=HDR_V2)
@@ -286,7 +883,9 @@ def _fetch_campaign_name(site_id: str, campaign_id: str) -> Optional[str]:
             name = resp.get("name") or resp.get("campaign", {}).get("name") or resp.get("data", {}).get("name")
         if name:
             name = str(name)
-            _campaign_name_cache[campaign_id] = name
+            with _campaign_name_lock:
+                _campaign_name_cache[campaign_id] = name
+                _campaign_name_dirty = True
             return name
     except Exception as e:
         log.debug("⚠️ Falha ao buscar nome da campanha %s: %s", campaign_id, e)
@@ -295,13 +894,22 @@ def _fetch_campaign_name(site_id: str, campaign_id: str) -> Optional[str]:
 # ---------------------------------------------------------------------
 # Promoção RAW → PROCESSED
 # ---------------------------------------------------------------------
+_PROMOTE_SORT_FIELDS = ("advertiser_id", "campaign_id", "date", "ad_id", "item_id")
+
 def _promote_to_processed(path_raw: str, sheet_name: str, key_fields: Tuple[str, ...],
-                          ensure_date_sorted: bool = True) -> str:
+                          ensure_date_sorted: bool = True, key_order: bool = False) -> str:
+    """
+    Copia o CSV RAW para PROCESSED (ordenado) e envia ao Sheets.
+    - key_order=False: ordena pelos campos de _PROMOTE_SORT_FIELDS presentes nos key_fields,
+      na ordem fixa dessa lista; key_order=True: na ordem dos próprios key_fields.
+    """
     header, rows = _read_csv(path_raw)
     if ensure_date_sorted and rows:
-        # ordena por campos que existirem entre os key_fields
-        keys = tuple(k for k in ("advertiser_id", "campaign_id", "date", "ad_id", "item_id") if k in key_fields)
-        rows = _sort_rows(rows, keys)
+        if key_order:
+            keys = tuple(k for k in key_fields if k in _PROMOTE_SORT_FIELDS)
+        else:
+            keys = tuple(k for k in _PROMOTE_SORT_FIELDS if k in key_fields)
+        rows = _sort_rows(rows, keys, str_values=True)
     out_path = os.path.join(PROCESSED_DIR, os.path.basename(path_raw))
     header_final = _stable_header_from_rows([], rows, strict=False)
     _write_atomic(out_path, header_final, rows)
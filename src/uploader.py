@@ -25,6 +25,10 @@ log = logging.getLogger("uploader")
 APPSCRIPT_URL   = os.getenv("GOOGLE_APPSCRIPT_URL", "").strip()
 APPSCRIPT_TOKEN = os.getenv("GOOGLE_APPSCRIPT_TOKEN", "").strip()
 
+# Sessão compartilhada: no --all os uploads reaproveitam a conexão keep-alive
+# com o Apps Script em vez de um handshake TCP+TLS por arquivo.
+SESSION = requests.Session()
+
 # -----------------------------------------------------------------------------
 # Utils
 # -----------------------------------------------------------------------------
@@ -66,11 +70,13 @@ def upload_csv(path: str, sheet: str) -> None:
     headers = {
         "Content-Type": "text/csv",
         "X-Filename": os.path.basename(path),
+        "Content-Length": str(size),  # corpo com tamanho conhecido (sem chunked)
     }
 
     log.info("⬆️ Enviando %s (%s bytes) → %s", path, size, url)
+    # passa o arquivo aberto: o corpo sai em streaming, sem cópia inteira em memória
     with open(path, "rb") as f:
-        resp = requests.post(url, data=f.read(), headers=headers, timeout=180)
+        resp = SESSION.post(url, data=f, headers=headers, timeout=180)
 
     try:
         resp.raise_for_status()